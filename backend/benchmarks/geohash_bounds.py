@@ -0,0 +1,74 @@
+# Checks that the geohash prefilter used by radius search never drops a point
+# the exact haversine filter accepts. Points are placed just inside the
+# radius on every bearing, across latitudes and radii; no database needed.
+#
+#   cd backend && python -m benchmarks.geohash_bounds
+import math
+import sys
+from core import geohash
+
+LATITUDES = range(-80, 81, 10)
+RADII_KM = (0.5, 5, 50, 100, 1000)
+BEARINGS = range(0, 360, 5)
+
+
+def destination(lat: float, lng: float, bearing: float, distance_km: float):
+    angle = distance_km / geohash.EARTH_RADIUS_KM
+    lat1, lng1, theta = map(math.radians, (lat, lng, bearing))
+    lat2 = math.asin(
+        math.sin(lat1) * math.cos(angle)
+        + math.cos(lat1) * math.sin(angle) * math.cos(theta)
+    )
+    lng2 = lng1 + math.atan2(
+        math.sin(theta) * math.sin(angle) * math.cos(lat1),
+        math.cos(angle) - math.sin(lat1) * math.sin(lat2),
+    )
+    return math.degrees(lat2), (math.degrees(lng2) + 540.0) % 360.0 - 180.0
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    # Same formula as PropertyService._distance_km
+    d_lat = math.radians(lat2 - lat1)
+    d_lng = math.radians(lng2 - lng1)
+    a = math.sin(d_lat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(
+        math.radians(lat2)
+    ) * math.sin(d_lng / 2) ** 2
+    return 2 * geohash.EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def in_box(box, lat: float, lng: float) -> bool:
+    # Mirrors PropertyService._bbox_filter: geohash ranges plus lat/lng bounds
+    min_lat, min_lng, max_lat, max_lng = box
+    if min_lng > max_lng:
+        return in_box((min_lat, min_lng, max_lat, 180.0), lat, lng) or in_box(
+            (min_lat, -180.0, max_lat, max_lng), lat, lng
+        )
+    if not (min_lat <= lat <= max_lat and min_lng <= lng <= max_lng):
+        return False
+    cell = geohash.encode(lat, lng)
+    cells = geohash.covering_cells(min_lat, min_lng, max_lat, max_lng)
+    return any(
+        start <= cell and (end is None or cell < end)
+        for start, end in geohash.cell_ranges(cells)
+    )
+
+
+def main() -> int:
+    failures = checked = 0
+    for lat in LATITUDES:
+        for radius_km in RADII_KM:
+            box = geohash.bbox_around(lat, 45.0, radius_km)
+            for bearing in BEARINGS:
+                point = destination(lat, 45.0, bearing, radius_km * (1 - 1e-9))
+                if haversine_km(lat, 45.0, *point) > radius_km:
+                    continue
+                checked += 1
+                if not in_box(box, *point):
+                    failures += 1
+                    print(f"missed lat={lat} r={radius_km}km bearing={bearing}")
+    print(f"{checked - failures}/{checked} edge points inside the prefilter")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
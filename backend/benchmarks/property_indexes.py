@@ -0,0 +1,178 @@
+# Checks that every filter combination accepted by GET /properties is served
+# by an index scan. Seeds synthetic listings inside a transaction that is
+# rolled back at the end, so it is safe to point at a development database.
+#
+#   cd backend && python -m benchmarks.property_indexes --rows 50000
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+from sqlalchemy import insert, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+from core.config import config
+from core.init_db import sync_schema
+from core import geohash
+from models.users import User  # noqa: F401
+from models.appointments import PropertyAppointment  # noqa: F401
+from models.properties import Property, PropertyStatus, PropertyType, SaleRent
+from schemas.property_schemas import PropertySort
+from services.property_service import property_service
+
+CITIES = ["Mogadishu", "Hargeisa", "Kismayo", "Baidoa", "Garowe", "Bosaso"]
+DESCRIPTIONS = [
+    "Quiet family home close to schools and the market",
+    "Modern apartment with a sea view and secure parking",
+    "Large villa with garden, sea view and a private well",
+    "Commercial unit on a busy main road",
+    "Open plot ready for construction",
+]
+
+class Explain(Executable, ClauseElement):
+    # EXPLAIN around a statement whose parameters stay bound, so values such
+    # as the regconfig in websearch_to_tsquery() go through the driver
+    # instead of needing a literal renderer.
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def compile_explain(element, compiler, **kw):
+    return "EXPLAIN (ANALYZE, FORMAT JSON) " + compiler.process(
+        element.statement, **kw
+    )
+
+
+FILTERS = {
+    "sale_or_rent": {"sale_or_rent": SaleRent.sale},
+    "city": {"city": "Garowe"},
+    "price": {"min_price": 50_000, "max_price": 60_000},
+    "type": {"type": PropertyType.apartment},
+    "agent_id": {"agent_id": str(uuid4())},
+}
+
+
+def seed_rows(count: int):
+    now = datetime.now()
+    statuses = [PropertyStatus.available] * 8 + [
+        PropertyStatus.sold,
+        PropertyStatus.rented,
+    ]
+    for _ in range(count):
+        latitude = random.uniform(-1.5, 11.5)
+        longitude = random.uniform(41.0, 51.5)
+        yield {
+            "id": uuid4(),
+            "title": "Benchmark listing",
+            "description": random.choice(DESCRIPTIONS),
+            "city": random.choice(CITIES),
+            "address": "Benchmark street",
+            "bedrooms": random.randint(1, 6),
+            "bathrooms": random.randint(1, 4),
+            "size": random.randint(40, 600),
+            "price": float(random.randint(10_000, 900_000)),
+            "published_date": now - timedelta(minutes=random.randint(0, 10**6)),
+            "featured": random.random() < 0.02,
+            "latitude": latitude,
+            "longitude": longitude,
+            "geohash": geohash.encode(latitude, longitude),
+            "type": random.choice(list(PropertyType)),
+            "status": random.choice(statuses),
+            "sale_or_rent": random.choice(list(SaleRent)),
+        }
+
+
+def scan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from scan_nodes(child)
+
+
+def describe(plan: dict) -> tuple[bool, str]:
+    scans = [
+        node
+        for node in scan_nodes(plan)
+        if node.get("Relation Name") == "properties"
+        or node["Node Type"] == "Bitmap Index Scan"
+    ]
+    uses_index = bool(scans) and all(
+        node["Node Type"] != "Seq Scan" for node in scans
+    )
+    summary = ", ".join(
+        f"{node['Node Type']}"
+        + (f" using {node['Index Name']}" if "Index Name" in node else "")
+        for node in scans
+    )
+    return uses_index, summary
+
+
+def cases():
+    names = list(FILTERS)
+    for size in range(len(names) + 1):
+        for combo in itertools.combinations(names, size):
+            kwargs = {}
+            for name in combo:
+                kwargs.update(FILTERS[name])
+            yield " + ".join(combo) or "(no filters)", kwargs
+    for sort in (PropertySort.price_asc, PropertySort.price_desc):
+        yield f"sort={sort.value}", {"sort": sort}
+    yield "bbox", {"bbox": "45.30,2.00,45.40,2.08"}
+    yield "radius", {"lat": 2.04, "lng": 45.34, "radius_km": 5}
+    yield "q", {"q": "sea view villa"}
+
+
+async def main(rows: int) -> int:
+    engine = create_async_engine(config.DATABASE_URL)
+    failures = 0
+    async with engine.connect() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(sync_schema)
+        await conn.commit()
+
+        transaction = await conn.begin()
+        started = time.perf_counter()
+        batch = list(seed_rows(rows))
+        for start in range(0, len(batch), 5_000):
+            await conn.execute(insert(Property), batch[start : start + 5_000])
+        await conn.execute(text("ANALYZE properties"))
+        print(f"Seeded {rows} rows in {time.perf_counter() - started:.1f}s\n")
+
+        checks = list(cases())
+        checks.append(("featured", None))
+        for name, kwargs in checks:
+            if kwargs is None:
+                query = property_service.build_featured_query()
+            else:
+                query = property_service.build_search_query(**kwargs)
+            result = await conn.execute(Explain(query))
+            explain = result.scalar_one()
+            if isinstance(explain, str):
+                explain = json.loads(explain)
+            plan = explain[0]
+            uses_index, summary = describe(plan["Plan"])
+            failures += not uses_index
+            print(
+                f"{'ok ' if uses_index else 'SEQ'}  {name:<45} "
+                f"{plan['Execution Time']:>8.2f} ms  {summary}"
+            )
+
+        await transaction.rollback()
+    await engine.dispose()
+    print(f"\n{len(checks) - failures}/{len(checks)} queries use an index")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50_000)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.rows)))
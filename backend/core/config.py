@@ -1,9 +1,21 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import SecretStr
+from typing import List, Optional
+from datetime import time
 
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_CONNECT_TIMEOUT: float = 10
+    DB_COMMAND_TIMEOUT: Optional[float] = None
+    # Prepared statements kept per connection; 0 behind pgbouncer
+    DB_STATEMENT_CACHE_SIZE: int = 500
     SECRET_KEY: str
     JWT_ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
@@ -13,6 +25,71 @@ class Settings(BaseSettings):
     MAIL_PORT: int
     MAIL_SERVER: str
     MAIL_TO_ADDRESS: str
+    PROPERTY_CACHE_TTL: int = 60
+    PROPERTY_CACHE_SIZE: int = 256
+    IMAGE_WORKERS: int = 2
+    IMAGE_QUALITY: int = 80
+    MAX_UPLOAD_BYTES: int = 15 * 1024 * 1024
+    MAX_AVATAR_BYTES: int = 5 * 1024 * 1024
+    UPLOAD_CONCURRENCY: int = 4
+    UPLOADS_MAX_AGE: int = 0
+    UPLOADS_PRECOMPRESSED: bool = False
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536
+    ARGON2_PARALLELISM: int = 4
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE: int = 32
+    USER_STATE_CACHE_TTL: int = 30
+    USER_STATE_CACHE_SIZE: int = 1024
+    TOKEN_CACHE_SIZE: int = 4096
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+    JWT_KEY_ROTATION_DAYS: int = 30
+    JWT_KEY_REFRESH_SECONDS: int = 300
+    JWT_KEY_PASSPHRASE: Optional[SecretStr] = None
+    REFRESH_TOKEN_STORE_URL: Optional[str] = None
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_STORE_URL: Optional[str] = None
+    RATE_LIMIT_MAX_KEYS: int = 100_000
+    RATE_LIMIT_LOGIN_IP: str = "20/minute"
+    RATE_LIMIT_LOGIN_USER: str = "5/minute"
+    RATE_LIMIT_CONTACT_IP: str = "5/hour"
+    RATE_LIMIT_CONTACT_EMAIL: str = "3/hour"
+    MAIL_STARTTLS: bool = True
+    MAIL_SSL_TLS: bool = False
+    MAIL_USE_CREDENTIALS: bool = True
+    MAIL_VALIDATE_CERTS: bool = True
+    MAIL_TIMEOUT_SECONDS: int = 30
+    MAIL_BATCH_SIZE: int = 20
+    MAIL_POLL_SECONDS: int = 30
+    MAIL_IDLE_SECONDS: int = 60
+    MAIL_MAX_ATTEMPTS: int = 8
+    MAIL_RETRY_BASE_SECONDS: int = 30
+    MAIL_RETRY_MAX_SECONDS: int = 3600
+    # IANA name; appointment input without an offset and working hours are
+    # read in this timezone, and responses are given in it
+    TIMEZONE: str = "Africa/Mogadishu"
+    # Zone the naive appointment times of older databases are read in when
+    # the column is converted to timestamptz. Offset-aware input was stored
+    # as UTC, so that is the default; rows booked with naive input held
+    # local wall-clock time and can't be told apart from them.
+    APPOINTMENT_LEGACY_TIMEZONE: str = "UTC"
+    APPOINTMENT_MINUTES: int = 30
+    WORKING_HOURS_START: time = time(9, 0)
+    WORKING_HOURS_END: time = time(18, 0)
+    WORKING_DAYS: List[int] = [0, 1, 2, 3, 4, 5]
+    CALENDAR_STREAM_BATCH: int = 500
+    # Off by default: the sweep relabels appointments agents never closed
+    # out, and the status it picks is a guess about what happened.
+    APPOINTMENT_SWEEP_ENABLED: bool = False
+    # Status given to scheduled/pending appointments that have gone by
+    APPOINTMENT_SWEEP_STATUS: str = "no_show_customer"
+    APPOINTMENT_SWEEP_GRACE_MINUTES: int = 60
+    # Only appointments that started within this many days are swept, so
+    # turning the sweeper on leaves older history alone. None sweeps all.
+    APPOINTMENT_SWEEP_LOOKBACK_DAYS: Optional[int] = 7
+    APPOINTMENT_SWEEP_INTERVAL_SECONDS: int = 300
+    APPOINTMENT_SWEEP_BATCH_SIZE: int = 500
+    CALENDAR_SYNC_OVERLAP_SECONDS: int = 60
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
 
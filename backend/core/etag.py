@@ -0,0 +1,26 @@
+from typing import Any, Optional
+from fastapi import Response, status
+
+
+def make_etag(*parts) -> str:
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored.
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def conditional_response(response: Response, etag: str, body: Any) -> Any:
+    # A None body means the client's copy is current; the route answers 304
+    # without validating or serializing anything.
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if body is None:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return body
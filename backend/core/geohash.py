@@ -0,0 +1,133 @@
+import math
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+PRECISION = 12
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode(latitude: float, longitude: float, precision: int = PRECISION) -> str:
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        span = lng_range if even else lat_range
+        point = longitude if even else latitude
+        mid = (span[0] + span[1]) / 2
+        value <<= 1
+        if point >= mid:
+            value |= 1
+            span[0] = mid
+        else:
+            span[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> tuple[float, float]:
+    bits = 5 * precision
+    lng_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / 2**lat_bits, 360.0 / 2**lng_bits
+
+
+def _grid_span(low: float, high: float, origin: float, step: float, cells: int):
+    first = min(int((low - origin) // step), cells - 1)
+    last = min(int((high - origin) // step), cells - 1)
+    return first, last
+
+
+def covering_cells(
+    min_lat: float, min_lng: float, max_lat: float, max_lng: float, max_cells: int = 32
+) -> list[str]:
+    # Pick the finest precision whose grid still covers the box in at most
+    # max_cells cells, then enumerate the cells by their centre points.
+    chosen = 1
+    for precision in range(1, PRECISION + 1):
+        height, width = cell_size(precision)
+        rows, cols = round(180 / height), round(360 / width)
+        lat_first, lat_last = _grid_span(min_lat, max_lat, -90.0, height, rows)
+        lng_first, lng_last = _grid_span(min_lng, max_lng, -180.0, width, cols)
+        if (lat_last - lat_first + 1) * (lng_last - lng_first + 1) > max_cells:
+            break
+        chosen = precision
+
+    height, width = cell_size(chosen)
+    rows, cols = round(180 / height), round(360 / width)
+    lat_first, lat_last = _grid_span(min_lat, max_lat, -90.0, height, rows)
+    lng_first, lng_last = _grid_span(min_lng, max_lng, -180.0, width, cols)
+    cells = set()
+    for row in range(lat_first, lat_last + 1):
+        for col in range(lng_first, lng_last + 1):
+            cells.add(
+                encode(-90.0 + (row + 0.5) * height, -180.0 + (col + 0.5) * width, chosen)
+            )
+    return sorted(cells)
+
+
+def _to_int(cell: str) -> int:
+    value = 0
+    for char in cell:
+        value = value * 32 + BASE32.index(char)
+    return value
+
+
+def _from_int(value: int, precision: int) -> str:
+    chars = []
+    for _ in range(precision):
+        value, digit = divmod(value, 32)
+        chars.append(BASE32[digit])
+    return "".join(reversed(chars))
+
+
+def cell_ranges(cells: list[str]) -> list[tuple[str, str | None]]:
+    # BASE32 is in ASCII order, so under a "C" collation every geohash inside
+    # a cell sorts between the cell and its successor. Adjacent cells merge
+    # into a single [start, end) range; end is None past the last cell.
+    ranges = []
+    if not cells:
+        return ranges
+    precision = len(cells[0])
+    values = sorted(_to_int(cell) for cell in cells)
+    start = previous = values[0]
+    for value in values[1:] + [None]:
+        if value is not None and value == previous + 1:
+            previous = value
+            continue
+        end = previous + 1
+        ranges.append(
+            (
+                _from_int(start, precision),
+                _from_int(end, precision) if end < 32**precision else None,
+            )
+        )
+        if value is not None:
+            start = previous = value
+    return ranges
+
+
+def bbox_around(
+    latitude: float, longitude: float, radius_km: float
+) -> tuple[float, float, float, float]:
+    # Smallest box holding the whole circle on the same sphere as the
+    # haversine filter. The widest longitude span is not at the centre's
+    # latitude but where the circle touches its meridian tangents, hence
+    # asin(sin(r) / cos(lat)) rather than r / cos(lat).
+    angle = radius_km / EARTH_RADIUS_KM
+    lat_delta = math.degrees(angle)
+    min_lat = max(latitude - lat_delta, -90.0)
+    max_lat = min(latitude + lat_delta, 90.0)
+    cos_lat = math.cos(math.radians(latitude))
+    if min_lat == -90.0 or max_lat == 90.0 or math.sin(angle) >= cos_lat:
+        return min_lat, -180.0, max_lat, 180.0
+    lng_delta = math.degrees(math.asin(math.sin(angle) / cos_lat))
+    min_lng = (longitude - lng_delta + 540.0) % 360.0 - 180.0
+    max_lng = (longitude + lng_delta + 540.0) % 360.0 - 180.0
+    return min_lat, min_lng, max_lat, max_lng
@@ -0,0 +1,46 @@
+from datetime import datetime, timezone
+
+# RFC 5545 helpers; just enough to write VCALENDAR/VEVENT text.
+LINE_LIMIT = 75
+
+
+def escape_text(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+        .replace("\r", "")
+    )
+
+
+def format_datetime(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def fold(line: str) -> str:
+    # Lines longer than 75 octets continue on the next line after a space,
+    # split on character boundaries so UTF-8 sequences stay whole.
+    if len(line.encode()) <= LINE_LIMIT:
+        return line
+    parts = []
+    current, size = [], 0
+    for char in line:
+        width = len(char.encode())
+        limit = LINE_LIMIT if not parts else LINE_LIMIT - 1
+        if size + width > limit:
+            parts.append("".join(current))
+            current, size = [], 0
+        current.append(char)
+        size += width
+    parts.append("".join(current))
+    return "\r\n ".join(parts)
+
+
+def content_lines(properties: list[tuple[str, str]]) -> str:
+    return "".join(fold(f"{key}:{value}") + "\r\n" for key, value in properties)
+
+
+def component(name: str, properties: list[tuple[str, str]]) -> str:
+    return f"BEGIN:{name}\r\n{content_lines(properties)}END:{name}\r\n"
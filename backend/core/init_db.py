@@ -1,10 +1,20 @@
+import time
+from zoneinfo import ZoneInfo
 from typing import AsyncGenerator
 from sqlmodel import SQLModel
 from .config import config
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy import CheckConstraint, bindparam, exc, inspect, select, text, update
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
+from sqlalchemy.schema import AddConstraint, CreateColumn
+from . import geohash
 from models.users import User
-from models.properties import Property, PropertyImage
-from models.appointments import PropertyAppointment
+from models.properties import Property, PropertyImage, ImageBlob
+from models.appointments import PropertyAppointment, AgentWorkingHours
+from models.revisions import TableRevision
+from models.signing_keys import SigningKey
+from models.mail import OutboundMail
 
 
 DATABASE_URL = config.DATABASE_URL
@@ -12,11 +22,219 @@ DATABASE_URL = config.DATABASE_URL
 engine = None
 AsyncSessionLocal = None
 
+# Indexes replaced by composites that lead with status; sync_schema drops them
+# from databases created before the change.
+RETIRED_INDEXES = ["ix_properties_city", "ix_properties_price", "ix_properties_type"]
+
+OVERLAP_REPORT_LIMIT = 50
+
+
+class SchemaConflictError(RuntimeError):
+    pass
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    # Tracks how long sessions wait to check out a connection, which
+    # includes opening a new one when the pool has room to grow.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        waited = time.perf_counter() - started
+        self.checkouts += 1
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return connection
+
+
+def pool_stats() -> dict:
+    if engine is None:
+        return {}
+    pool = engine.pool
+    return {
+        "size": pool.size(),  # type: ignore
+        "checked_out": pool.checkedout(),  # type: ignore
+        "idle": pool.checkedin(),  # type: ignore
+        "overflow": max(pool.overflow(), 0),  # type: ignore
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "checkouts": pool.checkouts,  # type: ignore
+        "timeouts": pool.timeouts,  # type: ignore
+        "avg_wait_ms": round(1000 * pool.wait_seconds / pool.checkouts, 2)  # type: ignore
+        if pool.checkouts  # type: ignore
+        else 0.0,
+        "max_wait_ms": round(1000 * pool.max_wait_seconds, 2),  # type: ignore
+    }
+
+
+def create_engine():
+    connect_args = {
+        "timeout": config.DB_CONNECT_TIMEOUT,
+        # SQLAlchemy's own prepared statement cache and asyncpg's
+        "prepared_statement_cache_size": config.DB_STATEMENT_CACHE_SIZE,
+        "statement_cache_size": config.DB_STATEMENT_CACHE_SIZE,
+    }
+    if config.DB_COMMAND_TIMEOUT is not None:
+        connect_args["command_timeout"] = config.DB_COMMAND_TIMEOUT
+    return create_async_engine(
+        DATABASE_URL,
+        echo=config.DB_ECHO,
+        poolclass=TimedQueuePool,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        pool_pre_ping=config.DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+
+def sync_schema(connection):
+    # create_all() skips tables that already exist, so columns, indexes and
+    # constraints added to a model later would never reach an existing
+    # database without this.
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    for table in SQLModel.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.exec_driver_sql(
+                    f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}"
+                )
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+        existing_constraints = set(
+            connection.execute(
+                text(
+                    "SELECT conname FROM pg_constraint "
+                    "WHERE conrelid = CAST(:table AS regclass)"
+                ),
+                {"table": preparer.format_table(table)},
+            ).scalars()
+        )
+        for constraint in table.constraints:
+            if (
+                isinstance(constraint, (CheckConstraint, ExcludeConstraint))
+                and constraint.name
+                and constraint.name not in existing_constraints
+            ):
+                # Existing rows may violate a new check constraint; report it
+                # and carry on rather than failing the whole startup.
+                try:
+                    with connection.begin_nested():
+                        connection.execute(AddConstraint(constraint))
+                except Exception as e:
+                    if isinstance(constraint, ExcludeConstraint):
+                        # Bookings rely on the exclusion constraint alone to
+                        # refuse overlaps, so starting without it is unsafe.
+                        raise SchemaConflictError(
+                            f"Could not add constraint {constraint.name}: {e}"
+                            f"{overlap_report(connection)}"
+                        ) from e
+                    print(f"Could not add constraint {constraint.name}: {e}")
+    for name in RETIRED_INDEXES:
+        connection.exec_driver_sql(f"DROP INDEX IF EXISTS {preparer.quote(name)}")
+
+
+def overlap_report(connection) -> str:
+    rows = connection.execute(
+        text(
+            "SELECT a.property_id, a.id, a.appointment_datetime, "
+            "b.id, b.appointment_datetime "
+            "FROM property_appointments a JOIN property_appointments b "
+            "ON a.property_id = b.property_id AND a.id < b.id "
+            "AND a.appointment_slot && b.appointment_slot "
+            "WHERE a.appointment_status <> 'cancelled' "
+            "AND b.appointment_status <> 'cancelled' "
+            "ORDER BY a.property_id, a.appointment_datetime "
+            "LIMIT :limit"
+        ),
+        {"limit": OVERLAP_REPORT_LIMIT},
+    ).all()
+    if not rows:
+        return ""
+    lines = [
+        f"  property {property_id}: {first_id} at {first_at} overlaps "
+        f"{second_id} at {second_at}"
+        for property_id, first_id, first_at, second_id, second_at in rows
+    ]
+    more = ""
+    if len(rows) == OVERLAP_REPORT_LIMIT:
+        more = f" (first {OVERLAP_REPORT_LIMIT})"
+    return (
+        f"\nOverlapping appointments{more}; cancel or move one of each pair:\n"
+        + "\n".join(lines)
+    )
+
+
+async def backfill_geohashes(conn, batch_size: int = 1000):
+    table = Property.__table__
+    while True:
+        result = await conn.execute(
+            select(table.c.id, table.c.latitude, table.c.longitude)
+            .where(table.c.geohash.is_(None))
+            .limit(batch_size)
+        )
+        rows = result.all()
+        if not rows:
+            break
+        await conn.execute(
+            update(table)
+            .where(table.c.id == bindparam("row_id"))
+            .values(geohash=bindparam("row_geohash")),
+            [
+                {
+                    "row_id": row.id,
+                    "row_geohash": geohash.encode(row.latitude, row.longitude),
+                }
+                for row in rows
+            ],
+        )
+
+
+async def migrate_appointment_timestamps(conn):
+    # appointment_datetime used to be a naive timestamp, read here in
+    # APPOINTMENT_LEGACY_TIMEZONE. The generated slot column depends on it,
+    # so it is dropped (with its exclusion constraint) and sync_schema adds
+    # both back with the UTC expression.
+    result = await conn.execute(
+        text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_schema = current_schema() "
+            "AND table_name = 'property_appointments' "
+            "AND column_name = 'appointment_datetime'"
+        )
+    )
+    if result.scalar() != "timestamp without time zone":
+        return
+    # Utility statements can't take bind parameters; ZoneInfo only accepts
+    # IANA names, which is checked before the name goes into the SQL.
+    tz = ZoneInfo(config.APPOINTMENT_LEGACY_TIMEZONE).key.replace("'", "''")
+    await conn.exec_driver_sql(
+        "ALTER TABLE property_appointments DROP COLUMN IF EXISTS appointment_slot"
+    )
+    await conn.exec_driver_sql(
+        "ALTER TABLE property_appointments ALTER COLUMN appointment_datetime "
+        f"TYPE timestamptz USING appointment_datetime AT TIME ZONE '{tz}'"
+    )
+    print(f"Converted appointment times to timestamptz from {tz}")
+
 
 async def init_db():
     global engine, AsyncSessionLocal
 
-    engine = create_async_engine(DATABASE_URL, echo=True, future=True)
+    engine = create_engine()
 
     AsyncSessionLocal = async_sessionmaker(
         bind=engine,
@@ -27,13 +245,26 @@ async def init_db():
 
     try:
         async with engine.begin() as conn:
+            # GiST support for plain equality, used by the appointment
+            # exclusion constraint on (property_id, appointment_slot).
+            await conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS btree_gist")
             await conn.run_sync(SQLModel.metadata.create_all)
+            await migrate_appointment_timestamps(conn)
+            await conn.run_sync(sync_schema)
+            await backfill_geohashes(conn)
             print("Database tables created successfully")
         print("Database Connected Successfully")
+    except SchemaConflictError:
+        raise
     except Exception as e:
         print(f"Failed to connect to the database: {e}")
 
 
+async def close_db():
+    if engine is not None:
+        await engine.dispose()
+
+
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     if AsyncSessionLocal is None:
         raise RuntimeError(
@@ -0,0 +1,39 @@
+from datetime import datetime
+from typing import Iterable
+
+Interval = tuple[datetime, datetime]
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> list[Interval]:
+    # Half-open [start, end) intervals; touching intervals are joined.
+    merged: list[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_intervals(
+    base: Iterable[Interval], busy: Iterable[Interval]
+) -> list[Interval]:
+    # Both inputs are merged and sorted first, so one sweep is enough.
+    busy = merge_intervals(busy)
+    free: list[Interval] = []
+    index = 0
+    for start, end in merge_intervals(base):
+        while index < len(busy) and busy[index][1] <= start:
+            index += 1
+        cursor = start
+        probe = index
+        while probe < len(busy) and busy[probe][0] < end:
+            busy_start, busy_end = busy[probe]
+            if busy_start > cursor:
+                free.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+            probe += 1
+        if cursor < end:
+            free.append((cursor, end))
+    return free
@@ -0,0 +1,133 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Optional
+from fastapi import HTTPException, Request, status
+from core.config import config
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_rate(spec: str) -> tuple[int, float]:
+    # "10/minute" is a bucket of 10 tokens that refills 10 tokens a minute.
+    count, _, period = spec.partition("/")
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period.strip()]
+
+
+class MemoryBucketStore:
+    # Process local and bounded: the least recently used buckets are dropped
+    # first, which only ever resets a client to a full bucket.
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def acquire(self, key: str, capacity: int, rate: float) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    async def close(self):
+        pass
+
+
+# Same algorithm as MemoryBucketStore, run atomically on the Redis clock.
+BUCKET_SCRIPT = """
+local now = redis.call('TIME')
+local t = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or t
+tokens = math.min(capacity, tokens + (t - updated) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', t)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(retry_after)
+"""
+
+
+class RedisBucketStore:
+    def __init__(self, url: str, prefix: str = "ratelimit"):
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError(
+                "RATE_LIMIT_STORE_URL is set but the redis package is not installed"
+            )
+        self._redis = redis.from_url(url, decode_responses=True)
+        self._script = self._redis.register_script(BUCKET_SCRIPT)
+        self._prefix = prefix
+
+    async def acquire(self, key: str, capacity: int, rate: float) -> float:
+        result = await self._script(
+            keys=[f"{self._prefix}:{key}"], args=[capacity, rate]
+        )
+        return float(result)
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+def create_bucket_store():
+    if config.RATE_LIMIT_STORE_URL:
+        return RedisBucketStore(config.RATE_LIMIT_STORE_URL)
+    return MemoryBucketStore(config.RATE_LIMIT_MAX_KEYS)
+
+
+bucket_store = create_bucket_store()
+
+
+class RateLimit:
+    # Route dependency rather than middleware: it runs after FastAPI has
+    # parsed the body, so buckets can be keyed by form or JSON fields, yet
+    # still before the handler does any hashing or SMTP work.
+    def __init__(self, name: str, rules: list[tuple[str, str]]):
+        # rules: (key, "N/period"); key is "ip" or the name of a body field.
+        self.name = name
+        self.rules = [(key, parse_rate(spec)) for key, spec in rules]
+
+    async def _key_value(self, request: Request, key: str) -> Optional[str]:
+        if key == "ip":
+            return request.client.host if request.client else None
+        if request.headers.get("content-type", "").startswith("application/json"):
+            body = await request.json()
+            value = body.get(key) if isinstance(body, dict) else None
+        else:
+            value = (await request.form()).get(key)
+        if not isinstance(value, str) or not value:
+            return None
+        return value.strip().lower()
+
+    async def __call__(self, request: Request):
+        if not config.RATE_LIMIT_ENABLED:
+            return
+        for key, (capacity, rate) in self.rules:
+            value = await self._key_value(request, key)
+            if value is None:
+                continue
+            retry_after = await bucket_store.acquire(
+                f"{self.name}:{key}:{value}", capacity, rate
+            )
+            if retry_after > 0:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many requests, please try again later",
+                    headers={"Retry-After": str(math.ceil(retry_after))},
+                )
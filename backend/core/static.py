@@ -0,0 +1,120 @@
+import os
+from mimetypes import guess_type
+from typing import Optional
+import anyio
+from starlette.datastructures import Headers, QueryParams
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+from core.config import config
+from services.image_service import VARIANTS, variant_name
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Preferred order when a client accepts several encodings.
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _accepted_encodings(header: str) -> set[str]:
+    accepted = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+class UploadFiles(StaticFiles):
+    # Files under blobs/ are named after the hash of their content, so they
+    # never change once written and can be cached forever. Everything else
+    # (avatars, legacy property folders) is overwritten in place and must be
+    # revalidated. Range requests are handled by FileResponse itself.
+    def __init__(self, directory: str, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.blob_root = os.path.realpath(os.path.join(directory, "blobs"))
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        # Temp files and the blob store's incoming folder are never served.
+        if any(part.startswith(".") for part in path.split(os.sep)):
+            raise HTTPException(status_code=404)
+        if scope["method"] in ("GET", "HEAD"):
+            path = await self._variant_path(path, scope)
+            if config.UPLOADS_PRECOMPRESSED:
+                response = await self._precompressed_response(path, scope)
+                if response is not None:
+                    return response
+        return await super().get_response(path, scope)
+
+    async def _variant_path(self, path: str, scope: Scope) -> str:
+        # ?variant=thumb|card|full swaps in the pre-resized WebP when it
+        # exists, and falls back to the original upload otherwise.
+        variant = QueryParams(scope["query_string"]).get("variant")
+        if variant not in VARIANTS:
+            return path
+        candidate = os.path.join(os.path.dirname(path), variant_name(path, variant))
+        _, stat_result = await anyio.to_thread.run_sync(self.lookup_path, candidate)
+        return candidate if stat_result is not None else path
+
+    async def _precompressed_response(
+        self, path: str, scope: Scope
+    ) -> Optional[Response]:
+        accepted = _accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        for encoding, suffix in PRECOMPRESSED:
+            if encoding not in accepted:
+                continue
+            full_path, stat_result = await anyio.to_thread.run_sync(
+                self.lookup_path, path + suffix
+            )
+            if stat_result is not None:
+                return self.file_response(
+                    full_path, stat_result, scope, encoding=encoding
+                )
+        return None
+
+    def _is_immutable(self, full_path) -> bool:
+        full_path = os.path.realpath(full_path)
+        return os.path.commonpath([full_path, self.blob_root]) == self.blob_root
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+        encoding: Optional[str] = None,
+    ) -> Response:
+        media_path = str(full_path)
+        immutable = self._is_immutable(full_path)
+        headers = {}
+        if immutable:
+            headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+        else:
+            headers["cache-control"] = (
+                f"public, max-age={config.UPLOADS_MAX_AGE}, must-revalidate"
+            )
+        if encoding is not None:
+            media_path = os.path.splitext(media_path)[0]
+            headers["content-encoding"] = encoding
+        if config.UPLOADS_PRECOMPRESSED:
+            headers["vary"] = "Accept-Encoding"
+        if immutable:
+            # The file name is the content hash, which makes a strong validator.
+            stem = os.path.splitext(os.path.basename(media_path))[0]
+            headers["etag"] = f'"{stem}-{encoding}"' if encoding else f'"{stem}"'
+
+        response = FileResponse(
+            full_path,
+            status_code=status_code,
+            headers=headers,
+            media_type=guess_type(media_path)[0] or "application/octet-stream",
+            stat_result=stat_result,
+        )
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,45 @@
+import os
+from typing import NamedTuple
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+
+
+class RenderedEmail(NamedTuple):
+    html: str
+    text: str
+
+
+class TemplateEngine:
+    # Templates are compiled once and kept for the life of the process;
+    # auto_reload is off so rendering never stats the template files.
+    def __init__(self, directory: str = TEMPLATES_DIR):
+        self.env = Environment(
+            loader=FileSystemLoader(directory),
+            autoescape=select_autoescape(["html"]),
+            undefined=StrictUndefined,
+            auto_reload=False,
+            cache_size=-1,
+            trim_blocks=True,
+            lstrip_blocks=True,
+        )
+
+    def compile_all(self) -> int:
+        names = self.env.list_templates(extensions=["html", "txt"])
+        for name in names:
+            self.env.get_template(name)
+        return len(names)
+
+    def render(self, template: str, /, **context) -> str:
+        return self.env.get_template(template).render(**context)
+
+    def render_email(self, template: str, /, **context) -> RenderedEmail:
+        # email/<template>.html is the HTML part, email/<template>.txt the
+        # plain-text part.
+        return RenderedEmail(
+            html=self.render(f"email/{template}.html", **context),
+            text=self.render(f"email/{template}.txt", **context),
+        )
+
+
+templates = TemplateEngine()
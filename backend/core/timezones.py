@@ -0,0 +1,17 @@
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+from core.config import config
+
+# Times are stored as UTC timestamptz and shown in the agency's timezone.
+DISPLAY_TZ = ZoneInfo(config.TIMEZONE)
+
+
+def to_utc(value: datetime) -> datetime:
+    # Naive input is wall-clock time in the display timezone
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=DISPLAY_TZ)
+    return value.astimezone(timezone.utc)
+
+
+def to_display(value: datetime) -> datetime:
+    return to_utc(value).astimezone(DISPLAY_TZ)
@@ -1,14 +1,23 @@
 import uvicorn
-from fastapi.staticfiles import StaticFiles
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes.properties import property_router
 from routes.users import user_router
-from routes.auth import auth_router
+from routes.auth import auth_router, jwks_router
 from routes.contact import contact_router
 from routes.appointments import appointment_router
+from routes.system import system_router
 from contextlib import asynccontextmanager
-from core.init_db import init_db
+from core.init_db import close_db, init_db
+from core.static import UploadFiles
+from core.templates import templates
+from services.image_service import image_service
+from security.security import password_hasher
+from services.key_service import key_service
+from services.token_store import refresh_token_store
+from core.rate_limit import bucket_store
+from services.mail_service import mail_service
+from services.appointment_service import appointment_service
 import os
 
 version = "v1"
@@ -18,7 +27,19 @@ version = "v1"
 async def lifespan(app: FastAPI):
     print("The server is starting up")
     await init_db()
+    templates.compile_all()
+    await key_service.start()
+    await mail_service.start()
+    await appointment_service.start()
     yield
+    await appointment_service.stop()
+    await mail_service.stop()
+    await key_service.stop()
+    await refresh_token_store.close()
+    await bucket_store.close()
+    image_service.shutdown()
+    password_hasher.shutdown()
+    await close_db()
     print("The server is shutting down")
 
 
@@ -31,7 +52,7 @@ app = FastAPI(
 
 
 uploads_path = os.path.join(os.path.dirname(__file__), "uploads")
-app.mount("/uploads", StaticFiles(directory=uploads_path), name="uploads")
+app.mount("/uploads", UploadFiles(directory=uploads_path), name="uploads")
 
 app.add_middleware(
     CORSMiddleware,
@@ -46,10 +67,12 @@ app.include_router(
 )
 app.include_router(user_router, prefix=f"/api/{version}/users", tags=["users"])
 app.include_router(auth_router, prefix=f"/api/{version}/auth", tags=["auth"])
+app.include_router(jwks_router, tags=["auth"])
 app.include_router(contact_router, prefix=f"/api/{version}", tags=["contact"])
 app.include_router(
     appointment_router, prefix=f"/api/{version}/appointments", tags=["appointments"]
 )
+app.include_router(system_router, prefix=f"/api/{version}/system", tags=["system"])
 
 
 if __name__ == "__main__":
@@ -1,8 +1,12 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import CheckConstraint, Column, Computed, Index, func, text
+import sqlalchemy.dialects.postgresql as pg
 from uuid import UUID, uuid4
-from datetime import datetime
+from datetime import datetime, time
 from typing import Optional, TYPE_CHECKING
 from enum import Enum
+from core.config import config
+from .mail import utc_now
 
 if TYPE_CHECKING:
     from .properties import Property
@@ -19,11 +23,105 @@ class AppointmentStatus(str, Enum):
 
 class PropertyAppointment(SQLModel, table=True):
     __tablename__ = "property_appointments"  # type: ignore
+    __table_args__ = (
+        # Availability and conflict checks scan one property's day at a time
+        Index(
+            "ix_property_appointments_property_id_datetime",
+            "property_id",
+            "appointment_datetime",
+        ),
+        # Keyset pagination over all appointments, with or without a status
+        Index(
+            "ix_property_appointments_datetime_id", "appointment_datetime", "id"
+        ),
+        Index(
+            "ix_property_appointments_status_datetime_id",
+            "appointment_status",
+            "appointment_datetime",
+            "id",
+        ),
+        # Calendar feeds diff an agent's properties by last change
+        Index(
+            "ix_property_appointments_property_id_updated_at",
+            "property_id",
+            "updated_at",
+        ),
+    )
 
     id: Optional[UUID] = Field(default_factory=uuid4, primary_key=True, index=True)
     customer_name: str = Field(nullable=False)
     customer_phone: str = Field(nullable=False)
-    appointment_datetime: datetime = Field(nullable=False, index=True)
+    appointment_datetime: datetime = Field(
+        sa_column=Column(pg.TIMESTAMP(timezone=True), nullable=False, index=True)
+    )
     appointment_status: AppointmentStatus = Field(default=AppointmentStatus.scheduled)
     property_id: UUID = Field(foreign_key="properties.id", nullable=False)
+    created_at: datetime = Field(
+        default_factory=utc_now,
+        sa_column=Column(
+            pg.TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
+        ),
+    )
+    # Bumped by every ORM or Core UPDATE through onupdate
+    updated_at: datetime = Field(
+        default_factory=utc_now,
+        sa_column=Column(
+            pg.TIMESTAMP(timezone=True),
+            nullable=False,
+            server_default=func.now(),
+            onupdate=func.now(),
+        ),
+    )
     property: "Property" = Relationship(back_populates="appointments")
+
+
+# The [start, end) range each appointment occupies. Like the property search
+# vector it stays off the model: Postgres derives it from the start time, and
+# the exclusion constraint below rejects overlapping bookings atomically, so
+# concurrent requests can't double-book without any application locking.
+# The duration is baked into the column when it is created. timestamptz
+# arithmetic is only STABLE, so the range is built from the UTC wall clock,
+# which is immutable and orders the same way.
+appointment_slot = Column(
+    "appointment_slot",
+    pg.TSRANGE,
+    Computed(
+        "tsrange(appointment_datetime AT TIME ZONE 'UTC', "
+        "(appointment_datetime AT TIME ZONE 'UTC') + "
+        f"interval '{config.APPOINTMENT_MINUTES} minutes', '[)')",
+        persisted=True,
+    ),
+    nullable=True,
+)
+PropertyAppointment.__table__.append_column(appointment_slot)  # type: ignore
+PropertyAppointment.__table__.append_constraint(  # type: ignore
+    pg.ExcludeConstraint(
+        (PropertyAppointment.__table__.c.property_id, "="),  # type: ignore
+        (appointment_slot, "&&"),
+        name="ex_property_appointments_no_overlap",
+        using="gist",
+        # Cancelled appointments give their slot back
+        where=text("appointment_status <> 'cancelled'"),
+    )
+)
+
+
+class AgentWorkingHours(SQLModel, table=True):
+    # One shift per agent and weekday (0 = Monday). Agents without any rows
+    # fall back to the default hours in config.
+    __tablename__ = "agent_working_hours"  # type: ignore
+    __table_args__ = (
+        CheckConstraint(
+            "weekday BETWEEN 0 AND 6", name="ck_agent_working_hours_weekday"
+        ),
+        CheckConstraint(
+            "start_time < end_time", name="ck_agent_working_hours_range"
+        ),
+    )
+
+    agent_id: UUID = Field(
+        foreign_key="users.id", primary_key=True, ondelete="CASCADE"
+    )
+    weekday: int = Field(primary_key=True)
+    start_time: time = Field(nullable=False)
+    end_time: time = Field(nullable=False)
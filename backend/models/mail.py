@@ -0,0 +1,51 @@
+from sqlmodel import SQLModel, Field, Column
+from sqlalchemy import Index
+import sqlalchemy.dialects.postgresql as pg
+from datetime import datetime, timezone
+from enum import Enum
+from uuid import UUID, uuid4
+from typing import List, Optional
+
+
+class MailStatus(str, Enum):
+    pending = "pending"
+    sent = "sent"
+    failed = "failed"
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class OutboundMail(SQLModel, table=True):
+    __tablename__ = "outbound_mail"  # type: ignore
+    __table_args__ = (
+        Index("ix_outbound_mail_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
+    recipients: List[str] = Field(
+        sa_column=Column(pg.ARRAY(pg.VARCHAR), nullable=False)
+    )
+    subject: str = Field(nullable=False)
+    body: str = Field(nullable=False)
+    subtype: str = Field(default="html", nullable=False)
+    # Plain-text alternative sent alongside an HTML body
+    text_body: Optional[str] = Field(default=None, nullable=True)
+    status: MailStatus = Field(default=MailStatus.pending, nullable=False)
+    attempts: int = Field(default=0, nullable=False)
+    last_error: Optional[str] = Field(default=None, nullable=True)
+    created_at: datetime = Field(
+        default_factory=utc_now,
+        sa_column=Column(pg.TIMESTAMP(timezone=True), nullable=False),
+    )
+    next_attempt_at: datetime = Field(
+        default_factory=utc_now,
+        sa_column=Column(pg.TIMESTAMP(timezone=True), nullable=False),
+    )
+    sent_at: Optional[datetime] = Field(
+        default=None, sa_column=Column(pg.TIMESTAMP(timezone=True), nullable=True)
+    )
+
+    def __repr__(self):
+        return f"<OutboundMail(id={self.id}, status={self.status})>"
@@ -1,4 +1,5 @@
 from sqlmodel import SQLModel, Field, Column, Relationship, ForeignKey
+from sqlalchemy import Computed, Index, text
 import sqlalchemy.dialects.postgresql as pg
 from pydantic import PositiveFloat, PositiveInt
 from datetime import datetime
@@ -31,6 +32,29 @@ class PropertyStatus(str, Enum):
 
 class Property(SQLModel, table=True):
     __tablename__ = "properties"  # type: ignore
+    # Every listing query filters on status first, so it leads each composite
+    # index; the trailing (column, id) pairs back the keyset pagination order.
+    __table_args__ = (
+        Index(
+            "ix_properties_status_sale_or_rent_city_price",
+            "status",
+            "sale_or_rent",
+            "city",
+            "price",
+        ),
+        Index("ix_properties_status_type_price", "status", "type", "price"),
+        Index("ix_properties_status_agent_id", "status", "agent_id"),
+        Index("ix_properties_status_published_date", "status", "published_date", "id"),
+        Index("ix_properties_status_price_id", "status", "price", "id"),
+        Index("ix_properties_status_geohash", "status", "geohash"),
+        # Appointment listings reach an agent's appointments through here
+        Index("ix_properties_agent_id_id", "agent_id", "id"),
+        Index(
+            "ix_properties_featured_available",
+            "published_date",
+            postgresql_where=text("featured AND status = 'available'"),
+        ),
+    )
 
     id: Optional[UUID] = Field(
         default_factory=uuid4,
@@ -40,21 +64,30 @@ class Property(SQLModel, table=True):
     )
     title: str = Field(nullable=False)
     description: str = Field(sa_column=Column(pg.TEXT, nullable=False))
-    city: str = Field(index=True, nullable=False)
+    city: str = Field(nullable=False)
     address: str = Field(nullable=False)
     bedrooms: PositiveInt = Field(nullable=False)
     bathrooms: PositiveInt = Field(nullable=False)
     size: PositiveInt = Field(nullable=False)
-    price: PositiveFloat = Field(index=True, nullable=False)
+    price: PositiveFloat = Field(nullable=False)
     published_date: datetime = Field(
         default_factory=datetime.now, sa_column=Column(pg.TIMESTAMP, nullable=False)
     )
     featured: bool = Field(sa_column=Column(pg.BOOLEAN, default=False, nullable=False))
     latitude: float = Field(ge=-90, le=90, nullable=False)
     longitude: float = Field(ge=-180, le=180, nullable=False)
+    # "C" collation keeps geohash prefixes contiguous in the B-tree, so a map
+    # viewport becomes a handful of index range scans.
+    geohash: Optional[str] = Field(
+        default=None, sa_column=Column(pg.VARCHAR(12, collation="C"), nullable=True)
+    )
     floor: Optional[PositiveInt] = Field(default=None, nullable=True)
-    type: PropertyType = Field(index=True, nullable=False)
+    type: PropertyType = Field(nullable=False)
     status: PropertyStatus = Field(default=PropertyStatus.available)
+    revision: int = Field(
+        default=1,
+        sa_column=Column(pg.INTEGER, nullable=False, server_default=text("1")),
+    )
     sale_or_rent: SaleRent = Field(nullable=False)
     agent_id: Optional[UUID] = Field(
         default=None,
@@ -78,6 +111,26 @@ class Property(SQLModel, table=True):
         return f"<Property(title={self.title}, city={self.city}, price={self.price})>"
 
 
+SEARCH_CONFIG = "english"
+
+# Kept off the SQLModel fields on purpose: the ORM never reads or writes it,
+# Postgres recomputes it on every insert and update, and list queries don't
+# drag the vector along with each row.
+search_vector = Column(
+    "search_vector",
+    pg.TSVECTOR,
+    Computed(
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(address, '')), 'B') || "
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'C')",
+        persisted=True,
+    ),
+    nullable=True,
+)
+Property.__table__.append_column(search_vector)  # type: ignore
+Index("ix_properties_search_vector", search_vector, postgresql_using="gin")
+
+
 class PropertyImage(SQLModel, table=True):
     __tablename__ = "property_images"  # type: ignore
     id: Optional[UUID] = Field(
@@ -87,6 +140,13 @@ class PropertyImage(SQLModel, table=True):
         ),
     )
     file_name: str = Field(nullable=False)
+    # Set for images in the content-addressed store; older uploads live in
+    # the per-property folder and have no blob.
+    blob_key: Optional[str] = Field(default=None, index=True, nullable=True)
+    has_variants: bool = Field(
+        default=False,
+        sa_column=Column(pg.BOOLEAN, nullable=False, server_default=text("false")),
+    )
     property_id: UUID = Field(
         sa_column=Column(
             pg.UUID(as_uuid=True),
@@ -98,3 +158,19 @@ class PropertyImage(SQLModel, table=True):
 
     def __repr__(self):
         return f"<PropertyImage(file_name={self.file_name}, property_id={self.property_id})>"
+
+
+class ImageBlob(SQLModel, table=True):
+    __tablename__ = "image_blobs"  # type: ignore
+
+    # sha256 of the content plus the original extension, e.g. "9f86d0...a08.jpg"
+    key: str = Field(primary_key=True)
+    size: int = Field(nullable=False)
+    ref_count: int = Field(default=0, nullable=False, index=True)
+    has_variants: bool = Field(
+        default=False,
+        sa_column=Column(pg.BOOLEAN, nullable=False, server_default=text("false")),
+    )
+
+    def __repr__(self):
+        return f"<ImageBlob(key={self.key}, ref_count={self.ref_count})>"
@@ -0,0 +1,11 @@
+from sqlmodel import SQLModel, Field
+
+
+class TableRevision(SQLModel, table=True):
+    __tablename__ = "table_revisions"  # type: ignore
+
+    name: str = Field(primary_key=True)
+    revision: int = Field(default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<TableRevision(name={self.name}, revision={self.revision})>"
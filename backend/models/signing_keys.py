@@ -0,0 +1,25 @@
+from sqlmodel import SQLModel, Field, Column
+import sqlalchemy.dialects.postgresql as pg
+from datetime import datetime
+
+
+class SigningKey(SQLModel, table=True):
+    __tablename__ = "signing_keys"  # type: ignore
+
+    kid: str = Field(primary_key=True)
+    algorithm: str = Field(nullable=False)
+    private_key: str = Field(nullable=False)
+    created_at: datetime = Field(
+        sa_column=Column(pg.TIMESTAMP(timezone=True), nullable=False)
+    )
+    # Published in the JWKS from creation, used for signing from activates_at
+    # and kept for verification until expires_at.
+    activates_at: datetime = Field(
+        sa_column=Column(pg.TIMESTAMP(timezone=True), nullable=False)
+    )
+    expires_at: datetime = Field(
+        sa_column=Column(pg.TIMESTAMP(timezone=True), nullable=False, index=True)
+    )
+
+    def __repr__(self):
+        return f"<SigningKey(kid={self.kid}, algorithm={self.algorithm})>"
@@ -1,4 +1,5 @@
 from sqlmodel import SQLModel, Field, Column, Relationship
+from sqlalchemy import text
 import sqlalchemy.dialects.postgresql as pg
 import uuid
 from enum import Enum
@@ -31,6 +32,16 @@ class User(SQLModel, table=True):
     email: EmailStr = Field(unique=True, nullable=False)
     phone_number: PhoneNumber = Field(unique=True, nullable=False)
     is_active: bool = Field(default=True, nullable=False)
+    # Embedded in issued tokens; bumping it revokes every outstanding token.
+    token_version: int = Field(
+        default=1,
+        sa_column=Column(pg.INTEGER, nullable=False, server_default=text("1")),
+    )
+    # Part of the ETag of every listing that embeds this user as its agent
+    revision: int = Field(
+        default=1,
+        sa_column=Column(pg.INTEGER, nullable=False, server_default=text("1")),
+    )
     hashed_password: str = Field(nullable=False)
     role: Roles = Field(nullable=False)
     avatar_url: Optional[str] = Field(default=None, nullable=True)
@@ -1,13 +1,24 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from schemas.appointment_schemas import (
+    AppointmentBulkStatusResult,
+    AppointmentBulkStatusUpdate,
     AppointmentCreate,
+    AppointmentOrder,
+    AppointmentPage,
     AppointmentStatusUpdate,
-    AppointmentRead,
+    Availability,
+    CalendarFeed,
+    WorkingHours,
 )
+from schemas.token_schema import Roles, TokenData
+from models.appointments import AppointmentStatus
 from services.appointment_service import appointment_service
 from sqlmodel.ext.asyncio.session import AsyncSession
 from core.init_db import get_session
+from security.auth import get_token_user, require_admin, validate_calendar_token
 from uuid import UUID
+from datetime import date, datetime
 from typing import List, Optional
 
 appointment_router = APIRouter()
@@ -21,12 +32,31 @@ async def create_appointment(
     return await appointment_service.create_appointment(appointment_data, session)
 
 
-@appointment_router.get("/", response_model=List[AppointmentRead])
+@appointment_router.get("/", response_model=AppointmentPage)
 async def get_appointments(
     agent_id: Optional[UUID] = None,
+    property_id: Optional[UUID] = None,
+    appointment_status: Optional[List[AppointmentStatus]] = Query(
+        None, alias="status"
+    ),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    order: AppointmentOrder = AppointmentOrder.asc,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
     session: AsyncSession = Depends(get_session),
 ):
-    return await appointment_service.get_appointments(session, agent_id)
+    return await appointment_service.get_appointments(
+        session,
+        agent_id=agent_id,
+        property_id=property_id,
+        statuses=appointment_status,
+        date_from=date_from,
+        date_to=date_to,
+        order=order,
+        limit=limit,
+        cursor=cursor,
+    )
 
 
 @appointment_router.patch("/appointment/{appointment_id}/status")
@@ -38,3 +68,88 @@ async def update_appointment_status(
     return await appointment_service.update_appointment_status(
         appointment_id, status_update.status, session
     )
+
+
+@appointment_router.patch("/status", response_model=AppointmentBulkStatusResult)
+async def bulk_update_appointment_status(
+    status_update: AppointmentBulkStatusUpdate,
+    current_user: TokenData = Depends(get_token_user),
+    session: AsyncSession = Depends(get_session),
+):
+    return await appointment_service.bulk_update_status(status_update, session)
+
+
+@appointment_router.get("/availability", response_model=Availability)
+async def get_availability(
+    property_id: UUID,
+    day: date = Query(..., alias="date"),
+    session: AsyncSession = Depends(get_session),
+):
+    return await appointment_service.get_availability(property_id, day, session)
+
+
+@appointment_router.get(
+    "/agents/{agent_id}/working-hours", response_model=List[WorkingHours]
+)
+async def get_working_hours(
+    agent_id: UUID,
+    session: AsyncSession = Depends(get_session),
+):
+    return await appointment_service.get_working_hours(agent_id, session)
+
+
+@appointment_router.put(
+    "/agents/{agent_id}/working-hours", response_model=List[WorkingHours]
+)
+async def set_working_hours(
+    agent_id: UUID,
+    hours: List[WorkingHours],
+    current_user: TokenData = Depends(require_admin),
+    session: AsyncSession = Depends(get_session),
+):
+    return await appointment_service.set_working_hours(agent_id, hours, session)
+
+
+@appointment_router.get("/agents/{agent_id}/calendar", response_model=CalendarFeed)
+async def get_calendar_feed(
+    agent_id: UUID,
+    request: Request,
+    current_user: TokenData = Depends(get_token_user),
+    session: AsyncSession = Depends(get_session),
+):
+    if current_user.role != Roles.admin and current_user.id != agent_id:
+        raise HTTPException(
+            status_code=403, detail="Not allowed to view this calendar"
+        )
+    token = await appointment_service.get_calendar_token(agent_id, session)
+    url = request.url_for("get_calendar", agent_id=agent_id)
+    return CalendarFeed(url=str(url.include_query_params(token=token)))
+
+
+@appointment_router.get("/agents/{agent_id}/calendar.ics")
+async def get_calendar(
+    agent_id: UUID,
+    token: str,
+    request: Request,
+    since: Optional[str] = None,
+    session: AsyncSession = Depends(get_session),
+):
+    # Subscribed calendar apps revalidate with If-None-Match; clients that
+    # keep the X-Sync-Token can pass it back as ?since= to get only changes.
+    await validate_calendar_token(agent_id, token, session)
+    etag, sync_token, body = await appointment_service.get_calendar(
+        agent_id,
+        session,
+        since=since,
+        if_none_match=request.headers.get("if-none-match"),
+    )
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "X-Sync-Token": sync_token,
+    }
+    if body is None:
+        return Response(status_code=304, headers=headers)
+    return StreamingResponse(
+        body, media_type="text/calendar; charset=utf-8", headers=headers
+    )
@@ -1,14 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
-import jwt
+import time
+from uuid import uuid4
+from fastapi import APIRouter, Depends, HTTPException, Body, Response
 from jwt.exceptions import InvalidTokenError
 from fastapi.security import OAuth2PasswordRequestForm
-from security.auth import create_access_token, create_refresh_token
+from security.auth import (
+    create_access_token,
+    create_refresh_token,
+    decode_token,
+    get_token_user,
+    validate_token_state,
+)
 from core.init_db import get_session
 from sqlmodel.ext.asyncio.session import AsyncSession
-from schemas.token_schema import Token
+from schemas.token_schema import Token, TokenData
 from typing import Annotated
 from services.user_service import user_service
+from services.key_service import key_service
+from services.token_store import refresh_token_store, RotateResult
 from core.config import config
+from core.rate_limit import RateLimit
 import datetime
 
 SECRET_KEY = config.SECRET_KEY
@@ -17,9 +27,17 @@ ACCESS_TOKEN_EXPIRE_MINUTES = config.ACCESS_TOKEN_EXPIRE_MINUTES
 
 
 auth_router = APIRouter()
+jwks_router = APIRouter()
 
+REFRESH_TOKEN_EXPIRE = datetime.timedelta(days=config.REFRESH_TOKEN_EXPIRE_DAYS)
 
-@auth_router.post("/login/")
+login_rate_limit = RateLimit(
+    "login",
+    [("ip", config.RATE_LIMIT_LOGIN_IP), ("username", config.RATE_LIMIT_LOGIN_USER)],
+)
+
+
+@auth_router.post("/login/", dependencies=[Depends(login_rate_limit)])
 async def login_for_access_token(
     user_data: Annotated[OAuth2PasswordRequestForm, Depends()],
     session: AsyncSession = Depends(get_session),
@@ -31,35 +49,109 @@ async def login_for_access_token(
         data={
             "sub": str(user.id),
             "role": user.role,
+            "ver": user.token_version,
         }
     )
 
+    # Each login starts a new refresh token family
+    family_id = uuid4().hex
+    jti = uuid4().hex
     refresh_token = create_refresh_token(
         data={
             "sub": str(user.id),
             "role": user.role,
             "name": user.name,
             "avatar": user.avatar_url,
-        }
+            "ver": user.token_version,
+            "fam": family_id,
+            "jti": jti,
+        },
+        expires_delta=REFRESH_TOKEN_EXPIRE,
+    )
+    await refresh_token_store.issue(
+        family_id,
+        str(user.id),
+        jti,
+        time.time() + REFRESH_TOKEN_EXPIRE.total_seconds(),
     )
     return Token(access_token=access_token, refresh_token=refresh_token)
 
 
 @auth_router.post("/refresh")
-async def refresh_access_token(refresh_token: str = Body(..., embed=True)):
+async def refresh_access_token(
+    refresh_token: str = Body(..., embed=True),
+    session: AsyncSession = Depends(get_session),
+):
     try:
-        payload = jwt.decode(refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(refresh_token)
         if payload.get("type") != "refresh":
             raise HTTPException(status_code=401, detail="Invalid token type")
         user_id = payload.get("sub")
         role = payload.get("role")
-        if not user_id:
+        version = payload.get("ver", 1)
+        family_id = payload.get("fam")
+        jti = payload.get("jti")
+        if not user_id or not family_id or not jti:
             raise HTTPException(status_code=401, detail="Invalid token")
     except InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
 
+    await validate_token_state(
+        TokenData(id=user_id, role=role, version=version), session
+    )
+
+    # Every refresh token works once; the family hands out its successor.
+    new_jti = uuid4().hex
+    result = await refresh_token_store.rotate(
+        family_id,
+        jti,
+        new_jti,
+        time.time() + REFRESH_TOKEN_EXPIRE.total_seconds(),
+    )
+    if result == RotateResult.reused:
+        print(f"Refresh token reuse detected for user {user_id}, family revoked")
+        raise HTTPException(status_code=401, detail="Refresh token reuse detected")
+    if result == RotateResult.unknown:
+        raise HTTPException(status_code=401, detail="Refresh token revoked")
+
     new_access_token = create_access_token(
-        data={"sub": user_id, "role": role},
+        data={"sub": user_id, "role": role, "ver": version},
         expires_delta=datetime.timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
     )
-    return {"access_token": new_access_token, "token_type": "bearer"}
+    claims = {k: v for k, v in payload.items() if k not in ("exp", "type")}
+    claims["jti"] = new_jti
+    new_refresh_token = create_refresh_token(
+        data=claims, expires_delta=REFRESH_TOKEN_EXPIRE
+    )
+    return Token(access_token=new_access_token, refresh_token=new_refresh_token)
+
+
+@auth_router.post("/logout", status_code=204)
+async def logout(refresh_token: str = Body(..., embed=True)):
+    try:
+        payload = decode_token(refresh_token)
+    except InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    if payload.get("type") != "refresh" or not payload.get("fam"):
+        raise HTTPException(status_code=401, detail="Invalid token type")
+    await refresh_token_store.revoke_family(payload["fam"])
+
+
+@auth_router.post("/logout-all", status_code=204)
+async def logout_everywhere(
+    current_user: TokenData = Depends(get_token_user),
+    session: AsyncSession = Depends(get_session),
+):
+    # Drops every refresh token family and retires outstanding access tokens
+    await refresh_token_store.revoke_user(str(current_user.id))
+    await user_service.revoke_tokens(current_user.id, session)
+
+
+@jwks_router.get("/.well-known/jwks.json")
+async def get_jwks(response: Response):
+    # Keys are published before they sign anything, so caching this for one
+    # refresh interval never hides a key that is already in use.
+    response.headers["Cache-Control"] = (
+        f"public, max-age={config.JWT_KEY_REFRESH_SECONDS}"
+    )
+    return key_service.jwks()
@@ -1,8 +1,20 @@
-from fastapi import APIRouter, HTTPException, Query, Depends, status, Form, UploadFile
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    Query,
+    Depends,
+    status,
+    Form,
+    UploadFile,
+    Request,
+    Response,
+)
 from sqlmodel.ext.asyncio.session import AsyncSession
 from schemas.property_schemas import (
     PropertyCreate,
     PropertyResponse,
+    PropertyPage,
+    PropertySort,
     PropertyType,
     SaleRent,
     FeaturedUpdate,
@@ -14,7 +26,8 @@ from pydantic import PositiveInt, PositiveFloat
 from services.property_service import property_service
 from security.auth import require_admin
 from uuid import UUID
-from schemas.user_schemas import UserRead
+from schemas.token_schema import TokenData
+from core.etag import conditional_response
 
 property_router = APIRouter()
 
@@ -36,7 +49,7 @@ async def create_property(
     sale_or_rent: SaleRent = Form(...),
     agent_id: UUID = Form(...),
     files: List[UploadFile] = Form(...),
-    current_user: UserRead = Depends(require_admin),
+    current_user: TokenData = Depends(require_admin),
     session: AsyncSession = Depends(get_session),
 ):
     property_data = PropertyCreate(
@@ -58,17 +71,27 @@ async def create_property(
     return await property_service.create_property(property_data, files, session)
 
 
-@property_router.get("/", response_model=List[PropertyResponse])
+@property_router.get("/", response_model=PropertyPage)
 async def get_all_properties(
+    request: Request,
+    response: Response,
     sale_or_rent: Optional[SaleRent] = Query(None),
     city: Optional[str] = Query(None),
     min_price: Optional[float] = Query(None),
     max_price: Optional[float] = Query(None),
     type: Optional[PropertyType] = Query(None),
     agent_id: Optional[str] = Query(None),
+    q: Optional[str] = Query(None, min_length=1, max_length=200),
+    sort: Optional[PropertySort] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: Optional[float] = Query(None, gt=0, le=500),
+    bbox: Optional[str] = Query(None, description="min_lng,min_lat,max_lng,max_lat"),
     session: AsyncSession = Depends(get_session),
 ):
-    properties = await property_service.get_properties(
+    etag, properties = await property_service.get_properties(
         sale_or_rent=sale_or_rent,
         city=city,
         min_price=min_price,
@@ -76,24 +99,42 @@ async def get_all_properties(
         type=type,
         agent_id=agent_id,
         session=session,
+        sort=sort,
+        limit=limit,
+        cursor=cursor,
+        lat=lat,
+        lng=lng,
+        radius_km=radius_km,
+        bbox=bbox,
+        q=q,
+        if_none_match=request.headers.get("if-none-match"),
     )
-    return properties
+    return conditional_response(response, etag, properties)
 
 
 @property_router.get("/property/{property_id}", response_model=PropertyResponse)
 async def get_property(
-    property_id: str, session: AsyncSession = Depends(get_session)
-) -> PropertyResponse:
-    property = await property_service.get_property(property_id, session)
-    return property
+    property_id: str,
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_session),
+):
+    etag, property = await property_service.get_property(
+        property_id, session, if_none_match=request.headers.get("if-none-match")
+    )
+    return conditional_response(response, etag, property)
 
 
 @property_router.get("/featured", response_model=List[PropertyResponse])
 async def get_featured_properties(
+    request: Request,
+    response: Response,
     session: AsyncSession = Depends(get_session),
 ):
-    properties = await property_service.get_featured_properties(session)
-    return properties
+    etag, properties = await property_service.get_featured_properties(
+        session, if_none_match=request.headers.get("if-none-match")
+    )
+    return conditional_response(response, etag, properties)
 
 
 @property_router.delete(
@@ -102,7 +143,7 @@ async def get_featured_properties(
 )
 async def delete_property(
     property_id: UUID,
-    current_user: UserRead = Depends(require_admin),
+    current_user: TokenData = Depends(require_admin),
     session: AsyncSession = Depends(get_session),
 ) -> None:
     await property_service.delete_property(property_id, session)
@@ -126,7 +167,7 @@ async def update_property(
     sale_or_rent: SaleRent = Form(...),
     agent_id: UUID = Form(...),
     files: List[UploadFile] = Form(...),
-    current_user: UserRead = Depends(require_admin),
+    current_user: TokenData = Depends(require_admin),
     session: AsyncSession = Depends(get_session),
 ):
     property_data = PropertyCreate(
@@ -155,7 +196,7 @@ async def update_property(
 async def update_featured(
     property_id: str,
     featured_update: FeaturedUpdate,
-    current_user: UserRead = Depends(require_admin),
+    current_user: TokenData = Depends(require_admin),
     session: AsyncSession = Depends(get_session),
 ) -> PropertyResponse:
     updated_property = await property_service.update_featured(
@@ -168,7 +209,7 @@ async def update_featured(
 async def update_status(
     property_id: str,
     status_update: StatusUpdate,
-    current_user: UserRead = Depends(require_admin),
+    current_user: TokenData = Depends(require_admin),
     session: AsyncSession = Depends(get_session),
 ):
     await property_service.update_status(property_id, status_update.status, session)
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends
+from core.init_db import pool_stats
+from schemas.token_schema import TokenData
+from security.auth import require_admin
+from security.security import password_hasher
+
+system_router = APIRouter()
+
+
+@system_router.get("/stats")
+async def get_stats(current_user: TokenData = Depends(require_admin)):
+    return {
+        "database_pool": pool_stats(),
+        "password_hasher": password_hasher.stats(),
+    }
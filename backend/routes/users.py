@@ -70,6 +70,7 @@ async def update_user(
     email: EmailStr = Form(...),
     phone_number: PhoneNumber = Form(...),
     role: Role = Form(...),
+    is_active: Optional[bool] = Form(None),
     avatar: Optional[UploadFile] = File(None),
     session: AsyncSession = Depends(get_session),
 ):
@@ -79,6 +80,7 @@ async def update_user(
         email=email,
         phone_number=phone_number,
         role=role,
+        is_active=is_active,
     )
     return await user_service.update_user(user_id, user_update_data, avatar, session)
 
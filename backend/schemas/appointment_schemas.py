@@ -1,8 +1,11 @@
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 from pydantic_extra_types.phone_numbers import PhoneNumber
 from uuid import UUID
-from datetime import datetime, timezone
+from datetime import date, datetime, time
+from typing import List, Optional
+from enum import Enum
 from models.appointments import AppointmentStatus
+from core.timezones import to_display, to_utc
 
 
 class AppointmentCreate(BaseModel):
@@ -11,15 +14,10 @@ class AppointmentCreate(BaseModel):
     appointment_datetime: datetime
     property_id: UUID
 
-    @field_validator("appointment_datetime", mode="before")
+    @field_validator("appointment_datetime")
     @classmethod
-    def make_naive(cls, v):
-        # If input is a string, parse it to datetime first
-        if isinstance(v, str):
-            v = datetime.fromisoformat(v)
-        if v.tzinfo is not None:
-            return v.astimezone(timezone.utc).replace(tzinfo=None)
-        return v
+    def normalize_timezone(cls, v: datetime) -> datetime:
+        return to_utc(v)
 
 
 class AppointmentRead(BaseModel):
@@ -33,6 +31,61 @@ class AppointmentRead(BaseModel):
     agent_name: str
     agent_id: UUID
 
+    @field_validator("appointment_datetime")
+    @classmethod
+    def display_timezone(cls, v: datetime) -> datetime:
+        return to_display(v)
+
+
+class AppointmentOrder(str, Enum):
+    asc = "asc"
+    desc = "desc"
+
+
+class AppointmentPage(BaseModel):
+    items: List[AppointmentRead]
+    next_cursor: Optional[str] = None
+
 
 class AppointmentStatusUpdate(BaseModel):
     status: AppointmentStatus
+
+
+class AppointmentBulkStatusUpdate(BaseModel):
+    ids: List[UUID] = Field(min_length=1, max_length=500)
+    status: AppointmentStatus
+
+
+class AppointmentBulkStatusResult(BaseModel):
+    updated: List[UUID]
+    not_found: List[UUID]
+
+
+class AvailabilitySlot(BaseModel):
+    start: datetime
+    end: datetime
+
+
+class Availability(BaseModel):
+    property_id: UUID
+    date: date
+    slot_minutes: int
+    slots: List[AvailabilitySlot]
+
+
+class CalendarFeed(BaseModel):
+    url: str
+
+
+class WorkingHours(BaseModel):
+    weekday: int = Field(ge=0, le=6, description="0 = Monday")
+    start_time: time
+    end_time: time
+
+    model_config = ConfigDict(from_attributes=True)
+
+    @model_validator(mode="after")
+    def check_range(self):
+        if self.start_time >= self.end_time:
+            raise ValueError("start_time must be before end_time")
+        return self
@@ -19,6 +19,13 @@ class SaleRent(str, Enum):
     rent = "rent"
 
 
+class PropertySort(str, Enum):
+    newest = "newest"
+    price_asc = "price_asc"
+    price_desc = "price_desc"
+    relevance = "relevance"
+
+
 class PropertyCreate(BaseModel):
     title: str
     city: str
@@ -44,6 +51,13 @@ class AgentInfo(BaseModel):
     avatar_path: str | None = Field(None, alias="avatar_url")
 
 
+class ImageVariants(BaseModel):
+    original: str
+    thumb: str
+    card: str
+    full: str
+
+
 class PropertyResponse(BaseModel):
     id: UUID
     title: str
@@ -64,12 +78,18 @@ class PropertyResponse(BaseModel):
     featured: bool
     status: PropertyStatus
     images: List[str] = []
+    image_variants: List[ImageVariants] = []
     agent: Optional[AgentInfo] = None
 
     class Config:
         from_attributes = True
 
 
+class PropertyPage(BaseModel):
+    items: List[PropertyResponse]
+    next_cursor: Optional[str] = None
+
+
 class FeaturedUpdate(BaseModel):
     featured: bool
 
@@ -19,3 +19,4 @@ class TokenData(BaseModel):
     role: Roles | None = None
     name: str | None = None
     avatar: str | None = None
+    version: int = 1
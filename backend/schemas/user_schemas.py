@@ -26,6 +26,7 @@ class UserUpdate(BaseModel):
     email: EmailStr
     phone_number: PhoneNumber
     role: Role
+    is_active: bool | None = None
 
 
 class UserProfileUpdate(BaseModel):
@@ -48,6 +49,7 @@ class UserRead(BaseModel):
     role: Role
     date_created: datetime
     is_active: bool
+    token_version: int = Field(1, exclude=True)
     avatar_path: str | None = Field(None, alias="avatar_url")
 
     model_config = ConfigDict(from_attributes=True)
@@ -1,15 +1,21 @@
+import base64
+import hashlib
+import hmac
+import time
 from datetime import datetime, timedelta, timezone
 from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 import jwt
 from jwt.exceptions import InvalidTokenError
+from core.cache import TTLCache
 from core.config import config
 from typing import Annotated
+from uuid import UUID
 from schemas.token_schema import TokenData
 from services.user_service import user_service
+from services.key_service import key_service
 from core.init_db import get_session
 from sqlalchemy.ext.asyncio import AsyncSession
-from schemas.user_schemas import UserRead
 
 SECRET_KEY = config.SECRET_KEY
 ALGORITHM = config.JWT_ALGORITHM
@@ -17,6 +23,46 @@ ACCESS_TOKEN_EXPIRE_MINUTES = config.ACCESS_TOKEN_EXPIRE_MINUTES
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login/")
 
+# Verified claims keyed by token digest; each entry lives until the token's
+# own exp, so a cache hit never outlives the signature check it stands for.
+token_cache = TTLCache(maxsize=config.TOKEN_CACHE_SIZE, ttl=0)
+
+
+def encode_token(payload: dict) -> str:
+    if not key_service.enabled:
+        return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+    signing_key = key_service.signing_key()
+    return jwt.encode(
+        payload,
+        signing_key.private_key,  # type: ignore
+        algorithm=ALGORITHM,
+        headers={"kid": signing_key.kid},
+    )
+
+
+def _verification_key(token: str):
+    if not key_service.enabled:
+        return SECRET_KEY
+    verification_key = key_service.verification_key(
+        jwt.get_unverified_header(token).get("kid")
+    )
+    if verification_key is None:
+        raise InvalidTokenError("Unknown signing key")
+    return verification_key
+
+
+def decode_token(token: str) -> dict:
+    key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(key)
+    if payload is None:
+        # algorithms is pinned to the configured one, so a token can't pick
+        # a weaker algorithm than the key it claims.
+        payload = jwt.decode(token, _verification_key(token), algorithms=[ALGORITHM])
+        expires_in = payload.get("exp", 0) - time.time()
+        if expires_in > 0:
+            token_cache.set(key, payload, ttl=expires_in)
+    return dict(payload)
+
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -27,8 +73,8 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
             minutes=ACCESS_TOKEN_EXPIRE_MINUTES
         )
 
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode.update({"exp": expire, "type": "access"})
+    encoded_jwt = encode_token(to_encode)
 
     return encoded_jwt
 
@@ -38,39 +84,89 @@ def create_refresh_token(data: dict, expires_delta: timedelta | None = None):
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
     else:
-        expire = datetime.now(timezone.utc) + timedelta(days=7)
+        expire = datetime.now(timezone.utc) + timedelta(
+            days=config.REFRESH_TOKEN_EXPIRE_DAYS
+        )
     to_encode.update({"exp": expire, "type": "refresh"})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = encode_token(to_encode)
     return encoded_jwt
 
 
-async def get_current_user(
-    token: Annotated[str, Depends(oauth2_scheme)],
-    session: AsyncSession = Depends(get_session),
-):
-    credentials_exception = HTTPException(
+def credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+
+async def validate_token_state(token_data: TokenData, session: AsyncSession):
+    # Deactivation, role and password changes bump the user's token version,
+    # which retires every token issued before the change.
+    state = await user_service.get_user_state(token_data.id, session)
+    if (
+        state is None
+        or not state.is_active
+        or state.token_version != token_data.version
+    ):
+        raise credentials_exception()
+
+
+def calendar_token(agent_id: UUID, token_version: int) -> str:
+    # Calendar apps can't send a bearer header, so the feed URL carries this
+    # instead. It is tied to the token version, so anything that retires the
+    # agent's tokens also retires the feed URL.
+    digest = hmac.new(
+        SECRET_KEY.encode(),
+        f"calendar:{agent_id}:{token_version}".encode(),
+        hashlib.sha256,
+    ).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+
+async def validate_calendar_token(
+    agent_id: UUID, token: str, session: AsyncSession
+):
+    state = await user_service.get_user_state(agent_id, session)
+    if (
+        state is None
+        or not state.is_active
+        or not hmac.compare_digest(
+            token, calendar_token(agent_id, state.token_version)
+        )
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid calendar token",
+        )
+
+
+async def get_token_user(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    session: AsyncSession = Depends(get_session),
+) -> TokenData:
+    # Trusts the signed claims; the only lookup is the cached user state,
+    # so most requests never touch the database.
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        role = payload.get("role")
+        payload = decode_token(token)
+        # Refresh tokens share the signing key but must never stand in for
+        # an access token; revoking a family would not stop them otherwise.
+        if payload.get("type") != "access":
+            raise credentials_exception()
         id = payload.get("sub")
         if id is None:
-            raise credentials_exception
-        token_data = TokenData(id=id, role=role)
+            raise credentials_exception()
+        token_data = TokenData(
+            id=id, role=payload.get("role"), version=payload.get("ver", 1)
+        )
     except InvalidTokenError:
-        raise credentials_exception
+        raise credentials_exception()
 
-    user = await user_service.get_user(token_data.id, session)
-    if user is None:
-        raise credentials_exception
-    return user
+    await validate_token_state(token_data, session)
+    return token_data
 
 
-def require_admin(current_user: UserRead = Depends(get_current_user)):
+def require_admin(current_user: TokenData = Depends(get_token_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admins only")
     return current_user
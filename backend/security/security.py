@@ -1,12 +1,96 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
+from core.config import config
 
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__time_cost=config.ARGON2_TIME_COST,
+    argon2__memory_cost=config.ARGON2_MEMORY_COST,
+    argon2__parallelism=config.ARGON2_PARALLELISM,
+)
 
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+class PasswordHasher:
+    # Argon2 burns tens of milliseconds of CPU per call. argon2-cffi releases
+    # the GIL, so a small thread pool keeps it off the event loop; callers
+    # beyond workers + queue are turned away instead of piling up.
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.limit = workers + queue_size
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="argon2"
+        )
 
+    async def _run(self, fn, *args):
+        if self.pending >= self.limit:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Password hashing is busy, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        submitted = time.monotonic()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+        def timed():
+            return time.monotonic(), fn(*args)
+
+        try:
+            started, result = await asyncio.get_running_loop().run_in_executor(
+                self._executor, timed
+            )
+            self.wait_seconds += started - submitted
+            self.completed += 1
+            return result
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify_and_update(
+        self, password: str, hashed_password: str
+    ) -> tuple[bool, Optional[str]]:
+        # The second value is a fresh hash when the stored one was made with
+        # different cost parameters than the current config.
+        return await self._run(pwd_context.verify_and_update, password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "limit": self.limit,
+            "in_flight": min(self.pending, self.workers),
+            "queued": max(self.pending - self.workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(1000 * self.wait_seconds / self.completed, 2)
+            if self.completed
+            else 0.0,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(
+    config.PASSWORD_HASH_WORKERS, config.PASSWORD_HASH_QUEUE
+)
+
+
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    valid, _ = await password_hasher.verify_and_update(plain_password, hashed_password)
+    return valid
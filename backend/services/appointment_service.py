@@ -1,87 +1,432 @@
-from typing import Optional
-from models.appointments import PropertyAppointment, AppointmentStatus
-from sqlalchemy import select, and_
+import asyncio
+from typing import AsyncIterator, Optional
+from models.appointments import (
+    AgentWorkingHours,
+    PropertyAppointment,
+    AppointmentStatus,
+)
+from sqlalchemy import any_, bindparam, delete, func, select, tuple_, update
+import sqlalchemy.dialects.postgresql as pg
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException, status
 from models.properties import Property
 from models.users import User
-from schemas.appointment_schemas import AppointmentCreate
-from datetime import timedelta, timezone
+from schemas.appointment_schemas import (
+    AppointmentBulkStatusResult,
+    AppointmentBulkStatusUpdate,
+    AppointmentCreate,
+    AppointmentOrder,
+    AppointmentPage,
+    AppointmentRead,
+    Availability,
+    AvailabilitySlot,
+    WorkingHours,
+)
+from datetime import date, datetime, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
+from core.config import config
+from core.intervals import subtract_intervals
+from core.timezones import DISPLAY_TZ, to_utc
+from core.pagination import decode_cursor, encode_cursor
+from core.etag import make_etag, etag_matches
+from core.init_db import get_session
+from core import ical
+from security.auth import calendar_token
+from services.user_service import user_service
+
+CALENDAR_STATUS = {
+    AppointmentStatus.pending: "TENTATIVE",
+    AppointmentStatus.cancelled: "CANCELLED",
+}
+
+EXCLUSION_VIOLATION = "23P01"
+FOREIGN_KEY_VIOLATION = "23503"
+
+
+def _blocks_slot():
+    # Cancelled appointments free their slot again
+    return PropertyAppointment.appointment_status != AppointmentStatus.cancelled
+
+
+# Past appointments still waiting on an outcome
+OPEN_STATUSES = (AppointmentStatus.scheduled, AppointmentStatus.pending)
 
 
 class AppointmentService:
-    async def create_appointment(
-        self, appointment_data: AppointmentCreate, session: AsyncSession
-    ):
-        # Define UTC+03:00 timezone
-        tz = timezone(timedelta(hours=3))
-        start = appointment_data.appointment_datetime
+    def __init__(self):
+        self._sweeper: Optional[asyncio.Task] = None
 
-        # Convert to UTC+03:00 and make naive (strip tzinfo for DB)
-        if start.tzinfo is not None:
-            start = start.astimezone(tz).replace(tzinfo=None)
-        else:
-            # Assume naive datetimes are already in UTC+03:00
-            pass
+    def _duration(self) -> timedelta:
+        return timedelta(minutes=config.APPOINTMENT_MINUTES)
 
-        end = start + timedelta(minutes=30)
+    def _shifts(self, day: date, schedule: dict[int, AgentWorkingHours]):
+        if schedule:
+            # Agents with a schedule are off on the weekdays it leaves out
+            hours = schedule.get(day.weekday())
+            if hours is None:
+                return []
+            return [
+                (
+                    datetime.combine(day, hours.start_time, tzinfo=DISPLAY_TZ),
+                    datetime.combine(day, hours.end_time, tzinfo=DISPLAY_TZ),
+                )
+            ]
+        if day.weekday() not in config.WORKING_DAYS:
+            return []
+        return [
+            (
+                datetime.combine(day, config.WORKING_HOURS_START, tzinfo=DISPLAY_TZ),
+                datetime.combine(day, config.WORKING_HOURS_END, tzinfo=DISPLAY_TZ),
+            )
+        ]
 
-        overlap_stmt = select(PropertyAppointment).where(
-            and_(
-                PropertyAppointment.property_id == appointment_data.property_id,  # type: ignore
-                PropertyAppointment.appointment_datetime < end,  # type: ignore
-                PropertyAppointment.appointment_datetime  # type: ignore
-                >= start - timedelta(minutes=30),
+    async def get_availability(
+        self, property_id: UUID, day: date, session: AsyncSession
+    ) -> Availability:
+        result = await session.execute(
+            select(Property.id, AgentWorkingHours)
+            .outerjoin(
+                AgentWorkingHours,
+                AgentWorkingHours.agent_id == Property.agent_id,  # type: ignore
+            )
+            .where(Property.id == property_id)  # type: ignore
+        )
+        rows = result.all()
+        if not rows:
+            raise HTTPException(status_code=404, detail="Property not found")
+        schedule = {hours.weekday: hours for _, hours in rows if hours is not None}
+        shifts = self._shifts(day, schedule)
+
+        duration = self._duration()
+        busy = []
+        if shifts:
+            # One range scan over (property_id, appointment_datetime), bounded
+            # by the shifts themselves; starting a slot early catches an
+            # appointment that runs into the first shift.
+            result = await session.execute(
+                select(PropertyAppointment.appointment_datetime).where(
+                    PropertyAppointment.property_id == property_id,  # type: ignore
+                    PropertyAppointment.appointment_datetime  # type: ignore
+                    > to_utc(shifts[0][0]) - duration,
+                    PropertyAppointment.appointment_datetime < shifts[-1][1],  # type: ignore
+                    _blocks_slot(),
+                )
             )
+            busy = [(start, start + duration) for start in result.scalars().all()]
+        free = subtract_intervals(shifts, busy)
+
+        # Slots sit on a grid from the start of each shift; a slot is open
+        # when one free interval covers it entirely.
+        now = datetime.now(timezone.utc)
+        slots = []
+        index = 0
+        for shift_start, shift_end in shifts:
+            start = shift_start
+            while start + duration <= shift_end:
+                end = start + duration
+                while index < len(free) and free[index][1] < end:
+                    index += 1
+                if index < len(free) and free[index][0] <= start and start >= now:
+                    slots.append(AvailabilitySlot(start=start, end=end))
+                start = end
+        return Availability(
+            property_id=property_id,
+            date=day,
+            slot_minutes=config.APPOINTMENT_MINUTES,
+            slots=slots,
+        )
+
+    async def get_working_hours(self, agent_id: UUID, session: AsyncSession):
+        result = await session.execute(
+            select(AgentWorkingHours)
+            .where(AgentWorkingHours.agent_id == agent_id)  # type: ignore
+            .order_by(AgentWorkingHours.weekday)  # type: ignore
         )
-        result = await session.execute(overlap_stmt)
-        if result.scalars().first():
+        return result.scalars().all()
+
+    async def set_working_hours(
+        self, agent_id: UUID, hours: list[WorkingHours], session: AsyncSession
+    ):
+        # Replaces the agent's whole week; an empty list restores the defaults
+        if len({h.weekday for h in hours}) != len(hours):
             raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Time already booked for this property, please pick another time.",
+                status_code=400, detail="Each weekday can only appear once"
             )
-        appointment_data_dict = appointment_data.model_dump()
-        appointment_data_dict["appointment_datetime"] = start
-        appointment = PropertyAppointment(**appointment_data_dict)
-        session.add(appointment)
+        if not await session.get(User, agent_id):
+            raise HTTPException(status_code=404, detail="Agent not found")
+        await session.execute(
+            delete(AgentWorkingHours).where(AgentWorkingHours.agent_id == agent_id)  # type: ignore
+        )
+        session.add_all(
+            AgentWorkingHours(agent_id=agent_id, **h.model_dump()) for h in hours
+        )
         await session.commit()
+        return await self.get_working_hours(agent_id, session)
+
+    async def _commit(self, session: AsyncSession):
+        try:
+            await session.commit()
+        except IntegrityError as e:
+            await session.rollback()
+            sqlstate = getattr(e.orig, "sqlstate", None)
+            if sqlstate == EXCLUSION_VIOLATION:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Time already booked for this property, please pick another time.",
+                )
+            if sqlstate == FOREIGN_KEY_VIOLATION:
+                raise HTTPException(status_code=404, detail="Property not found")
+            raise
+
+    async def create_appointment(
+        self, appointment_data: AppointmentCreate, session: AsyncSession
+    ):
+        appointment = PropertyAppointment(**appointment_data.model_dump())
+        session.add(appointment)
+        # Overlaps are rejected by the exclusion constraint on insert, so
+        # there is no separate check that a concurrent booking could slip past.
+        await self._commit(session)
         await session.refresh(appointment)
         return {
             "message": "Your appointment is scheduled successfully! We will contact you soon"
         }
 
+    def _parse_cursor(self, cursor: str, order: AppointmentOrder):
+        order_name, value, last_id = decode_cursor(cursor, 3)
+        if order_name != order.value:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cursor does not match the requested order",
+            )
+        try:
+            return datetime.fromisoformat(value), UUID(last_id)
+        except (AttributeError, TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+            )
+
     async def get_appointments(
-        self, session: AsyncSession, agent_id: Optional[UUID] = None
-    ):
-        stmt = (
-            select(PropertyAppointment, Property, User)
+        self,
+        session: AsyncSession,
+        agent_id: Optional[UUID] = None,
+        property_id: Optional[UUID] = None,
+        statuses: Optional[list[AppointmentStatus]] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        order: AppointmentOrder = AppointmentOrder.asc,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+    ) -> AppointmentPage:
+        # Only the columns the page needs; the range and status filters plus
+        # the (datetime, id) keyset keep each page an index range scan.
+        query = (
+            select(
+                PropertyAppointment.id,
+                PropertyAppointment.customer_name,
+                PropertyAppointment.customer_phone,
+                PropertyAppointment.appointment_datetime,
+                PropertyAppointment.appointment_status,
+                PropertyAppointment.property_id,
+                Property.title.label("property_title"),  # type: ignore
+                Property.agent_id,
+                User.name.label("agent_name"),  # type: ignore
+            )
             .join(Property, PropertyAppointment.property_id == Property.id)  # type: ignore
             .join(User, Property.agent_id == User.id)  # type: ignore
         )
         if agent_id:
-            stmt = stmt.where(User.id == agent_id)  # type: ignore
-        result = await session.execute(stmt)
-        appointments = []
-        for appointment, property, agent in result.all():
-            appointments.append(
-                {
-                    "customer_name": appointment.customer_name,
-                    "customer_phone": appointment.customer_phone,
-                    "appointment_datetime": appointment.appointment_datetime,
-                    "property_id": property.id,
-                    "property_title": property.title,
-                    "agent_id": agent.id,
-                    "agent_name": getattr(
-                        agent, "name", getattr(agent, "full_name", "")
-                    )
-                    if agent
-                    else "N/A",
-                    "appointment_status": appointment.appointment_status,
-                    "id": appointment.id,
-                }
-            )
-        return appointments
+            query = query.where(Property.agent_id == agent_id)  # type: ignore
+        if property_id:
+            query = query.where(PropertyAppointment.property_id == property_id)  # type: ignore
+        if statuses:
+            query = query.where(PropertyAppointment.appointment_status.in_(statuses))  # type: ignore
+        if date_from:
+            query = query.where(
+                PropertyAppointment.appointment_datetime >= to_utc(date_from)  # type: ignore
+            )
+        if date_to:
+            query = query.where(
+                PropertyAppointment.appointment_datetime < to_utc(date_to)  # type: ignore
+            )
+
+        key = tuple_(PropertyAppointment.appointment_datetime, PropertyAppointment.id)
+        ascending = order == AppointmentOrder.asc
+        if cursor:
+            bound = tuple_(*self._parse_cursor(cursor, order))
+            query = query.where(key > bound if ascending else key < bound)
+        if ascending:
+            query = query.order_by(
+                PropertyAppointment.appointment_datetime.asc(),  # type: ignore
+                PropertyAppointment.id.asc(),  # type: ignore
+            )
+        else:
+            query = query.order_by(
+                PropertyAppointment.appointment_datetime.desc(),  # type: ignore
+                PropertyAppointment.id.desc(),  # type: ignore
+            )
+        # One extra row tells whether another page exists
+        result = await session.execute(query.limit(limit + 1))
+        rows = result.mappings().all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(
+                order.value, last["appointment_datetime"].isoformat(), last["id"]
+            )
+        return AppointmentPage(
+            items=[AppointmentRead.model_validate(dict(row)) for row in rows],
+            next_cursor=next_cursor,
+        )
+
+    def _parse_sync_token(self, token: str):
+        value, count, properties, property_revision = decode_cursor(token, 4)
+        try:
+            return (
+                datetime.fromisoformat(value) if value else None,
+                int(count),
+                (int(properties), int(property_revision)),
+            )
+        except (TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid sync token"
+            )
+
+    async def get_calendar(
+        self,
+        agent_id: UUID,
+        session: AsyncSession,
+        since: Optional[str] = None,
+        if_none_match: Optional[str] = None,
+    ) -> tuple[str, str, Optional[AsyncIterator[bytes]]]:
+        # Returns (etag, sync token, body). The ETag and sync token come from
+        # aggregates over the agent's appointments and properties; the body
+        # is None when the client's copy is current.
+        since_at, since_count, since_properties = (
+            self._parse_sync_token(since) if since else (None, 0, None)
+        )
+        # Every property write bumps its revision, so a title change or a
+        # property moving to or from this agent changes the sum or count.
+        result = await session.execute(
+            select(func.count(), func.coalesce(func.sum(Property.revision), 0)).where(
+                Property.agent_id == agent_id  # type: ignore
+            )
+        )
+        properties = tuple(result.one())
+        columns = [func.count(), func.max(PropertyAppointment.updated_at)]
+        if since_at is not None:
+            columns.append(
+                func.count().filter(PropertyAppointment.created_at <= since_at)
+            )
+        result = await session.execute(
+            select(*columns)
+            .join(Property, PropertyAppointment.property_id == Property.id)  # type: ignore
+            .where(Property.agent_id == agent_id)  # type: ignore
+        )
+        total, latest, *existing = result.one()
+        # Edits leave created_at alone, so a different number of rows created
+        # by the token's time means rows were deleted or arrived with a
+        # reassigned property, untouched since. A changed property can also
+        # alter the SUMMARY of old rows. Only a full feed covers those; edited
+        # rows, cancellations included, go out in the delta.
+        if since_at is not None and (
+            existing[0] != since_count or properties != since_properties
+        ):
+            since_at = None
+
+        sync_token = encode_cursor(
+            latest.isoformat() if latest else None, total, *properties
+        )
+        etag = make_etag(
+            "calendar",
+            agent_id,
+            total,
+            int(latest.timestamp() * 1_000_000) if latest else 0,
+            *properties,
+            int(since_at.timestamp() * 1_000_000) if since_at else "full",
+        )
+        if etag_matches(if_none_match, etag):
+            return etag, sync_token, None
+        return etag, sync_token, self._stream_calendar(agent_id, since_at)
+
+    async def _stream_calendar(
+        self, agent_id: UUID, since_at: Optional[datetime]
+    ) -> AsyncIterator[bytes]:
+        query = (
+            select(
+                PropertyAppointment.id,
+                PropertyAppointment.customer_name,
+                PropertyAppointment.customer_phone,
+                PropertyAppointment.appointment_datetime,
+                PropertyAppointment.appointment_status,
+                PropertyAppointment.updated_at,
+                Property.title.label("property_title"),  # type: ignore
+            )
+            .join(Property, PropertyAppointment.property_id == Property.id)  # type: ignore
+            .where(Property.agent_id == agent_id)  # type: ignore
+            .order_by(
+                PropertyAppointment.appointment_datetime,  # type: ignore
+                PropertyAppointment.id,  # type: ignore
+            )
+        )
+        if since_at is not None:
+            # Timestamps are taken when a transaction starts, so a change can
+            # commit after a token that sorts later; the overlap re-sends
+            # those. Resent events just overwrite themselves by UID.
+            overlap = timedelta(seconds=config.CALENDAR_SYNC_OVERLAP_SECONDS)
+            query = query.where(PropertyAppointment.updated_at > since_at - overlap)  # type: ignore
+
+        yield (
+            "BEGIN:VCALENDAR\r\n"
+            + ical.content_lines(
+                [
+                    ("VERSION", "2.0"),
+                    ("PRODID", "-//Guryasamo//Appointments//EN"),
+                    ("CALSCALE", "GREGORIAN"),
+                    ("X-WR-CALNAME", "Appointments"),
+                ]
+            )
+        ).encode()
+        # The request's session is closed before the body is sent, so the
+        # stream runs in its own. yield_per makes asyncpg fetch through a
+        # server-side cursor a batch at a time.
+        async for session in get_session():
+            result = await session.stream(
+                query.execution_options(yield_per=config.CALENDAR_STREAM_BATCH)
+            )
+            async for rows in result.mappings().partitions():
+                yield "".join(self._calendar_event(row) for row in rows).encode()
+        yield b"END:VCALENDAR\r\n"
+
+    def _calendar_event(self, row) -> str:
+        start = row["appointment_datetime"]
+        appointment_status = row["appointment_status"]
+        description = (
+            f"Customer: {row['customer_name']}\n"
+            f"Phone: {row['customer_phone']}\n"
+            f"Status: {appointment_status.value}"
+        )
+        return ical.component(
+            "VEVENT",
+            [
+                ("UID", f"{row['id']}@appointments"),
+                ("DTSTAMP", ical.format_datetime(row["updated_at"])),
+                ("LAST-MODIFIED", ical.format_datetime(row["updated_at"])),
+                ("DTSTART", ical.format_datetime(start)),
+                ("DTEND", ical.format_datetime(start + self._duration())),
+                ("SUMMARY", ical.escape_text(f"Viewing: {row['property_title']}")),
+                ("DESCRIPTION", ical.escape_text(description)),
+                ("STATUS", CALENDAR_STATUS.get(appointment_status, "CONFIRMED")),
+            ],
+        )
+
+    async def get_calendar_token(self, agent_id: UUID, session: AsyncSession) -> str:
+        state = await user_service.get_user_state(agent_id, session)
+        if state is None:
+            raise HTTPException(status_code=404, detail="Agent not found")
+        return calendar_token(agent_id, state.token_version)
 
     async def update_appointment_status(
         self,
@@ -96,9 +441,104 @@ class AppointmentService:
         if not appointment:
             raise HTTPException(status_code=404, detail="Appointment not found")
         appointment.appointment_status = status
-        await session.commit()
+        await self._commit(session)
         await session.refresh(appointment)
         return {"message": "Appointment status updated successfully"}
 
+    async def bulk_update_status(
+        self, status_update: AppointmentBulkStatusUpdate, session: AsyncSession
+    ) -> AppointmentBulkStatusResult:
+        # One statement for the whole batch. The ids go in as a single array
+        # parameter, so every batch size shares one prepared statement.
+        ids = list(dict.fromkeys(status_update.ids))
+        result = await session.execute(
+            update(PropertyAppointment)
+            .where(
+                PropertyAppointment.id  # type: ignore
+                == any_(bindparam("ids", ids, type_=pg.ARRAY(pg.UUID)))
+            )
+            .values(appointment_status=status_update.status)
+            .returning(PropertyAppointment.id)
+            .execution_options(synchronize_session=False)
+        )
+        updated = set(result.scalars().all())
+        # Un-cancelling can collide with a booking made in the meantime
+        await self._commit(session)
+        return AppointmentBulkStatusResult(
+            updated=[i for i in ids if i in updated],
+            not_found=[i for i in ids if i not in updated],
+        )
+
+    async def sweep_past_appointments(self, session: AsyncSession) -> int:
+        # Closes out appointments that ended more than the grace period ago
+        # and were never given an outcome. Each batch is its own short
+        # transaction; SKIP LOCKED lets several app processes sweep at once.
+        target = AppointmentStatus(config.APPOINTMENT_SWEEP_STATUS)
+        cutoff = (
+            datetime.now(timezone.utc)
+            - self._duration()
+            - timedelta(minutes=config.APPOINTMENT_SWEEP_GRACE_MINUTES)
+        )
+        conditions = [
+            PropertyAppointment.appointment_status.in_(OPEN_STATUSES),  # type: ignore
+            PropertyAppointment.appointment_datetime < cutoff,  # type: ignore
+        ]
+        if config.APPOINTMENT_SWEEP_LOOKBACK_DAYS is not None:
+            conditions.append(
+                PropertyAppointment.appointment_datetime  # type: ignore
+                >= cutoff - timedelta(days=config.APPOINTMENT_SWEEP_LOOKBACK_DAYS)
+            )
+        batch_size = config.APPOINTMENT_SWEEP_BATCH_SIZE
+        swept = 0
+        while True:
+            batch = (
+                select(PropertyAppointment.id)
+                .where(*conditions)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            result = await session.execute(
+                update(PropertyAppointment)
+                .where(PropertyAppointment.id.in_(batch.scalar_subquery()))  # type: ignore
+                .values(appointment_status=target)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+            swept += result.rowcount
+            if result.rowcount < batch_size:
+                return swept
+
+    async def _run_sweeper(self):
+        while True:
+            try:
+                async for session in get_session():
+                    swept = await self.sweep_past_appointments(session)
+                    if swept:
+                        print(
+                            f"Marked {swept} past appointments as "
+                            f"{config.APPOINTMENT_SWEEP_STATUS}"
+                        )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error sweeping appointments: {e}")
+            await asyncio.sleep(config.APPOINTMENT_SWEEP_INTERVAL_SECONDS)
+
+    async def start(self):
+        if not config.APPOINTMENT_SWEEP_ENABLED or self._sweeper is not None:
+            return
+        # Fail at startup rather than on every sweep
+        AppointmentStatus(config.APPOINTMENT_SWEEP_STATUS)
+        self._sweeper = asyncio.create_task(self._run_sweeper())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
 
 appointment_service = AppointmentService()
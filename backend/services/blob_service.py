@@ -0,0 +1,163 @@
+import asyncio
+import os
+from collections import Counter
+from typing import NamedTuple
+from uuid import uuid4
+from models.properties import ImageBlob
+from sqlalchemy import bindparam, delete, event, update
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio.session import AsyncSession
+from sqlmodel import select
+from starlette.concurrency import run_in_threadpool
+from services.image_service import image_service, variant_name, VARIANTS
+from services.upload_service import upload_service
+
+BLOB_ROOT = "uploads/blobs"
+INCOMING_DIR = os.path.join(BLOB_ROOT, ".incoming")
+# session.info key for files written in the session's open transaction
+CREATED_BLOBS = "created_blob_paths"
+
+
+class StoredBlob(NamedTuple):
+    key: str
+    has_variants: bool
+
+
+def _move_into_place(tmp_path: str, final_path: str) -> bool:
+    # The bytes are identical either way; replacing rather than skipping
+    # restores the file if a rolled-back upload is removing it right now.
+    existed = os.path.exists(final_path)
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(tmp_path, final_path)
+    return not existed
+
+
+def _remove_blob_files(path: str):
+    directory = os.path.dirname(path)
+    for name in [os.path.basename(path)] + [
+        variant_name(path, variant) for variant in VARIANTS
+    ]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+@event.listens_for(Session, "after_commit")
+def _keep_created_blobs(session):
+    session.info.pop(CREATED_BLOBS, None)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_created_blobs(session):
+    # Without their rows, collect_garbage would never find these files
+    for path in session.info.pop(CREATED_BLOBS, ()):
+        _remove_blob_files(path)
+
+
+class BlobService:
+    def blob_path(self, key: str) -> str:
+        return os.path.join(BLOB_ROOT, key[:2], key)
+
+    def blob_base_url(self, key: str) -> str:
+        return f"/uploads/blobs/{key[:2]}"
+
+    def _blob_key(self, sha256: str, filename) -> str:
+        extension = os.path.splitext(upload_service.safe_name(filename))[1].lower()
+        return sha256 + extension
+
+    async def store_many(self, files, session: AsyncSession) -> list[StoredBlob]:
+        # Each upload adds one reference to its blob. Files written here are
+        # removed again if the caller's transaction rolls back instead of
+        # committing.
+        tmp_paths = [os.path.join(INCOMING_DIR, uuid4().hex) for _ in files]
+        uploads = await upload_service.save_many(list(zip(files, tmp_paths)))
+        keys = [
+            self._blob_key(upload.sha256, file.filename)
+            for file, upload in zip(files, uploads)
+        ]
+        created = []
+        try:
+            stored: list[StoredBlob] = [None] * len(files)  # type: ignore
+            # Rows are locked in key order, so concurrent uploads sharing
+            # blobs can't deadlock on each other.
+            for index in sorted(range(len(files)), key=keys.__getitem__):
+                key, tmp_path, upload = keys[index], tmp_paths[index], uploads[index]
+                # The upsert locks the blob row until commit, so garbage
+                # collection can't remove the file between this check and then.
+                result = await session.execute(
+                    insert(ImageBlob)
+                    .values(key=key, size=upload.size, ref_count=1)
+                    .on_conflict_do_update(
+                        index_elements=[ImageBlob.key],
+                        set_={"ref_count": ImageBlob.ref_count + 1},
+                    )
+                    .returning(ImageBlob.has_variants)
+                )
+                has_variants = result.scalar_one()
+                path = self.blob_path(key)
+                if await run_in_threadpool(_move_into_place, tmp_path, path):
+                    created.append(path)
+                    has_variants = False
+                stored[index] = StoredBlob(key, has_variants)
+
+            pending = list({blob.key for blob in stored if not blob.has_variants})
+            rendered = await asyncio.gather(
+                *(
+                    image_service.generate_variants(
+                        self.blob_path(key), os.path.dirname(self.blob_path(key))
+                    )
+                    for key in pending
+                )
+            )
+            done = [key for key, ok in zip(pending, rendered) if ok]
+            if done:
+                await session.execute(
+                    update(ImageBlob)
+                    .where(ImageBlob.key.in_(done))  # type: ignore
+                    .values(has_variants=True)
+                )
+            session.info.setdefault(CREATED_BLOBS, []).extend(created)
+            return [
+                StoredBlob(blob.key, blob.has_variants or blob.key in done)
+                for blob in stored
+            ]
+        except BaseException:
+            for path in created:
+                await run_in_threadpool(_remove_blob_files, path)
+            for tmp_path in tmp_paths:
+                await upload_service.remove(tmp_path)
+            raise
+
+    async def release(self, keys, session: AsyncSession):
+        counts = Counter(key for key in keys if key)
+        if not counts:
+            return
+        table = ImageBlob.__table__
+        await session.execute(
+            update(table)  # type: ignore
+            .where(table.c.key == bindparam("blob_key"))  # type: ignore
+            .values(ref_count=table.c.ref_count - bindparam("released")),  # type: ignore
+            [{"blob_key": key, "released": n} for key, n in counts.items()],
+        )
+
+    async def collect_garbage(self, session: AsyncSession, batch_size: int = 100):
+        # Rows are locked while their files are removed, so a concurrent
+        # upload of the same bytes waits and then writes the file again.
+        result = await session.execute(
+            select(ImageBlob.key)
+            .where(ImageBlob.ref_count <= 0)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        keys = result.scalars().all()
+        for key in keys:
+            await run_in_threadpool(_remove_blob_files, self.blob_path(key))
+        if keys:
+            await session.execute(delete(ImageBlob).where(ImageBlob.key.in_(keys)))  # type: ignore
+        await session.commit()
+        return len(keys)
+
+
+blob_service = BlobService()
@@ -0,0 +1,93 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+from PIL import Image, ImageOps
+from core.config import config
+
+# Target widths; images narrower than a target are re-encoded, not upscaled.
+VARIANTS = {"thumb": 320, "card": 768, "full": 1600}
+VARIANT_FORMAT = "webp"
+
+
+def variant_name(file_name: str, variant: str) -> str:
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    return f"{stem}_{variant}.{VARIANT_FORMAT}"
+
+
+def render_variants(source_path: str, dest_dir: str, quality: int) -> list[str]:
+    # Runs in a worker process: decoding and resampling are CPU bound and
+    # would otherwise hold the event loop for hundreds of milliseconds.
+    written = []
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        for variant, width in VARIANTS.items():
+            resized = image
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.Resampling.LANCZOS)
+            name = variant_name(source_path, variant)
+            tmp_path = os.path.join(dest_dir, f".{name}.tmp")
+            resized.save(tmp_path, format=VARIANT_FORMAT, quality=quality, method=4)
+            os.replace(tmp_path, os.path.join(dest_dir, name))
+            written.append(name)
+    return written
+
+
+class ImageService:
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn rather than fork: forking a process that already runs an
+            # event loop and DB connection pool copies state it must not touch.
+            self._executor = ProcessPoolExecutor(
+                max_workers=config.IMAGE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def generate_variants(self, source_path: str, dest_dir: str) -> bool:
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(
+                self._pool(),
+                render_variants,
+                source_path,
+                dest_dir,
+                config.IMAGE_QUALITY,
+            )
+            return True
+        except BrokenProcessPool as e:
+            # A crashed worker poisons the whole pool; start a fresh one next time.
+            self._executor = None
+            print(f"Image worker pool crashed while processing {source_path}: {e}")
+            return False
+        except Exception as e:
+            # Listings fall back to the original upload when variants are missing.
+            print(f"Error generating variants for {source_path}: {e}")
+            return False
+
+    def variant_urls(self, base_url: str, file_name: str, has_variants: bool):
+        original = f"{base_url}/{file_name}"
+        urls = {"original": original}
+        for variant in VARIANTS:
+            urls[variant] = (
+                f"{base_url}/{variant_name(file_name, variant)}"
+                if has_variants
+                else original
+            )
+        return urls
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+image_service = ImageService()
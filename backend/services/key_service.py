@@ -0,0 +1,210 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+from uuid import uuid4
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from jwt.algorithms import get_default_algorithms
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio.session import AsyncSession
+from sqlmodel import select
+from starlette.concurrency import run_in_threadpool
+from core.config import config
+from core.init_db import get_session
+from models.signing_keys import SigningKey
+
+# Serialises rotation across nodes sharing the database.
+ROTATION_LOCK_ID = 7_311_014
+
+EC_CURVES = {
+    "ES256": ec.SECP256R1,
+    "ES384": ec.SECP384R1,
+    "ES512": ec.SECP521R1,
+    "ES521": ec.SECP521R1,
+}
+
+
+class LoadedKey(NamedTuple):
+    kid: str
+    algorithm: str
+    private_key: object
+    public_key: object
+    activates_at: datetime
+    expires_at: datetime
+
+
+def is_asymmetric(algorithm: str) -> bool:
+    return algorithm[:2] in ("RS", "PS", "ES") or algorithm == "EdDSA"
+
+
+def _generate_private_key(algorithm: str):
+    if algorithm[:2] in ("RS", "PS"):
+        return rsa.generate_private_key(public_exponent=65537, key_size=3072)
+    if algorithm in EC_CURVES:
+        return ec.generate_private_key(EC_CURVES[algorithm]())
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    raise ValueError(f"Unsupported JWT algorithm {algorithm}")
+
+
+def _encryption():
+    if config.JWT_KEY_PASSPHRASE is None:
+        return serialization.NoEncryption()
+    return serialization.BestAvailableEncryption(
+        config.JWT_KEY_PASSPHRASE.get_secret_value().encode()
+    )
+
+
+def _passphrase() -> Optional[bytes]:
+    if config.JWT_KEY_PASSPHRASE is None:
+        return None
+    return config.JWT_KEY_PASSPHRASE.get_secret_value().encode()
+
+
+def _dump_private_key(private_key) -> str:
+    return private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=_encryption(),
+    ).decode()
+
+
+def _load_key(row: SigningKey) -> LoadedKey:
+    private_key = serialization.load_pem_private_key(
+        row.private_key.encode(), password=_passphrase()
+    )
+    return LoadedKey(
+        row.kid,
+        row.algorithm,
+        private_key,
+        private_key.public_key(),  # type: ignore
+        row.activates_at,
+        row.expires_at,
+    )
+
+
+class KeyService:
+    # Asymmetric signing keys live in the database so every node signs and
+    # verifies with the same set. A new key is created ahead of its
+    # activation time, which gives every node (and JWKS consumers) a full
+    # refresh interval to learn it before the first token signed with it.
+    def __init__(self):
+        self._keys: dict[str, LoadedKey] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return is_asymmetric(config.JWT_ALGORITHM)
+
+    def _prepublish(self) -> timedelta:
+        return timedelta(seconds=2 * config.JWT_KEY_REFRESH_SECONDS)
+
+    def _lifetime(self) -> timedelta:
+        # A key must outlive the last refresh token it signed.
+        return (
+            timedelta(days=config.JWT_KEY_ROTATION_DAYS)
+            + timedelta(days=config.REFRESH_TOKEN_EXPIRE_DAYS)
+            + self._prepublish()
+        )
+
+    async def _create_key(self, activates_at: datetime, session: AsyncSession):
+        algorithm = config.JWT_ALGORITHM
+        private_key = await run_in_threadpool(_generate_private_key, algorithm)
+        pem = await run_in_threadpool(_dump_private_key, private_key)
+        session.add(
+            SigningKey(
+                kid=uuid4().hex,
+                algorithm=algorithm,
+                private_key=pem,
+                created_at=datetime.now(timezone.utc),
+                activates_at=activates_at,
+                expires_at=activates_at + self._lifetime(),
+            )
+        )
+
+    async def rotate(self, session: AsyncSession):
+        await session.execute(select(func.pg_advisory_xact_lock(ROTATION_LOCK_ID)))
+        now = datetime.now(timezone.utc)
+        result = await session.execute(
+            select(func.max(SigningKey.activates_at)).where(
+                SigningKey.algorithm == config.JWT_ALGORITHM,
+                SigningKey.expires_at > now,
+            )
+        )
+        newest = result.scalar()
+        rotation = timedelta(days=config.JWT_KEY_ROTATION_DAYS)
+        if newest is None:
+            # Nothing to verify yet, so the first key can sign straight away.
+            await self._create_key(now, session)
+        elif newest + rotation - self._prepublish() <= now:
+            await self._create_key(
+                max(newest + rotation, now + self._prepublish()), session
+            )
+        await session.commit()
+
+    async def refresh(self, session: AsyncSession):
+        await self.rotate(session)
+        result = await session.execute(
+            select(SigningKey).where(
+                SigningKey.algorithm == config.JWT_ALGORITHM,
+                SigningKey.expires_at > datetime.now(timezone.utc),
+            )
+        )
+        rows = result.scalars().all()
+        keys = {}
+        for row in rows:
+            keys[row.kid] = self._keys.get(row.kid) or await run_in_threadpool(
+                _load_key, row
+            )
+        self._keys = keys
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                async for session in get_session():
+                    await self.refresh(session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error refreshing JWT signing keys: {e}")
+            await asyncio.sleep(config.JWT_KEY_REFRESH_SECONDS)
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        try:
+            async for session in get_session():
+                await self.refresh(session)
+        except Exception as e:
+            print(f"Error loading JWT signing keys: {e}")
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def signing_key(self) -> LoadedKey:
+        now = datetime.now(timezone.utc)
+        active = [key for key in self._keys.values() if key.activates_at <= now]
+        if not active:
+            raise RuntimeError("No active JWT signing key is loaded")
+        return max(active, key=lambda key: key.activates_at)
+
+    def verification_key(self, kid: Optional[str]):
+        key = self._keys.get(kid) if kid else None
+        if key is None or key.expires_at <= datetime.now(timezone.utc):
+            return None
+        return key.public_key
+
+    def jwks(self) -> dict:
+        algorithms = get_default_algorithms()
+        keys = []
+        for key in sorted(self._keys.values(), key=lambda key: key.activates_at):
+            jwk = algorithms[key.algorithm].to_jwk(key.public_key, as_dict=True)
+            jwk.update({"kid": key.kid, "alg": key.algorithm, "use": "sig"})
+            keys.append(jwk)
+        return {"keys": keys}
+
+
+key_service = KeyService()
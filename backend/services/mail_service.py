@@ -0,0 +1,200 @@
+import asyncio
+import random
+from datetime import timedelta
+from email.message import EmailMessage
+from typing import Optional
+import aiosmtplib
+from sqlalchemy.ext.asyncio.session import AsyncSession
+from sqlmodel import select
+from core.config import config
+from core.init_db import get_session
+from models.mail import MailStatus, OutboundMail, utc_now
+
+
+def _build_message(mail: OutboundMail) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = config.MAIL_FROM
+    message["To"] = ", ".join(mail.recipients)
+    message["Subject"] = mail.subject
+    if mail.text_body:
+        message.set_content(mail.text_body)
+        message.add_alternative(mail.body, subtype=mail.subtype)
+    else:
+        message.set_content(mail.body, subtype=mail.subtype)
+    return message
+
+
+class MailService:
+    # Requests only insert a row; a background worker delivers queued mail
+    # over one long-lived SMTP connection. Rows are claimed with SKIP LOCKED,
+    # so several app processes can run workers against the same queue.
+    def __init__(self):
+        self._smtp: Optional[aiosmtplib.SMTP] = None
+        self._last_used = 0.0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def enqueue(
+        self,
+        recipients: list[str],
+        subject: str,
+        body: str,
+        session: AsyncSession,
+        subtype: str = "html",
+        text_body: Optional[str] = None,
+    ) -> OutboundMail:
+        mail = OutboundMail(
+            recipients=recipients,
+            subject=subject,
+            body=body,
+            subtype=subtype,
+            text_body=text_body,
+        )
+        session.add(mail)
+        await session.commit()
+        self._wakeup.set()
+        return mail
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        loop = asyncio.get_running_loop()
+        if self._smtp is not None and self._smtp.is_connected:
+            self._last_used = loop.time()
+            return self._smtp
+        smtp = aiosmtplib.SMTP(
+            hostname=config.MAIL_SERVER,
+            port=config.MAIL_PORT,
+            use_tls=config.MAIL_SSL_TLS,
+            start_tls=config.MAIL_STARTTLS,
+            validate_certs=config.MAIL_VALIDATE_CERTS,
+            timeout=config.MAIL_TIMEOUT_SECONDS,
+        )
+        await smtp.connect()
+        if config.MAIL_USE_CREDENTIALS:
+            await smtp.login(
+                config.MAIL_USERNAME, config.MAIL_PASSWORD.get_secret_value()
+            )
+        self._smtp = smtp
+        self._last_used = loop.time()
+        return smtp
+
+    async def _disconnect(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp is None:
+            return
+        try:
+            if smtp.is_connected:
+                await smtp.quit()
+        except aiosmtplib.SMTPException:
+            smtp.close()
+
+    async def _send(self, message: EmailMessage):
+        # The server may have dropped an idle connection; reconnect once.
+        for attempt in range(2):
+            smtp = await self._connect()
+            try:
+                await smtp.send_message(message)
+                return
+            except (aiosmtplib.SMTPServerDisconnected, ConnectionError):
+                await self._disconnect()
+                if attempt:
+                    raise
+
+    def _retry_delay(self, attempts: int) -> timedelta:
+        delay = min(
+            config.MAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+            config.MAIL_RETRY_MAX_SECONDS,
+        )
+        return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+    async def process_batch(self, session: AsyncSession) -> tuple[int, bool]:
+        # Returns how many rows were attempted and whether the batch was cut
+        # short because the server could not be reached.
+        result = await session.execute(
+            select(OutboundMail)
+            .where(
+                OutboundMail.status == MailStatus.pending,
+                OutboundMail.next_attempt_at <= utc_now(),
+            )
+            .order_by(OutboundMail.next_attempt_at)  # type: ignore
+            .limit(config.MAIL_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        batch = result.scalars().all()
+        attempted = 0
+        aborted = False
+        for mail in batch:
+            attempted += 1
+            try:
+                await self._send(_build_message(mail))
+                mail.status = MailStatus.sent
+                mail.sent_at = utc_now()
+                mail.last_error = None
+            except (aiosmtplib.SMTPException, OSError) as e:
+                await self._disconnect()
+                mail.attempts += 1
+                mail.last_error = str(e)[:500]
+                # 5xx replies are permanent; anything else is worth retrying.
+                permanent = isinstance(e, aiosmtplib.SMTPResponseException) and (
+                    500 <= e.code < 600
+                )
+                if permanent or mail.attempts >= config.MAIL_MAX_ATTEMPTS:
+                    mail.status = MailStatus.failed
+                    print(f"Giving up on mail {mail.id}: {e}")
+                else:
+                    mail.next_attempt_at = utc_now() + self._retry_delay(mail.attempts)
+                    print(f"Error sending mail {mail.id}, will retry: {e}")
+                if not isinstance(e, aiosmtplib.SMTPResponseException):
+                    # The server is unreachable; leave the rest of the batch
+                    # for the next round instead of timing out on each one.
+                    aborted = True
+                    break
+        await session.commit()
+        return attempted, aborted
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            processed, aborted = 0, False
+            try:
+                async for session in get_session():
+                    processed, aborted = await self.process_batch(session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in mail worker: {e}")
+            if aborted:
+                # Back off for a full poll interval, even if new mail is
+                # queued meanwhile, rather than reconnecting in a tight loop.
+                await asyncio.sleep(config.MAIL_POLL_SECONDS)
+                continue
+            if processed >= config.MAIL_BATCH_SIZE:
+                continue
+            if (
+                self._smtp is not None
+                and loop.time() - self._last_used > config.MAIL_IDLE_SECONDS
+            ):
+                await self._disconnect()
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), timeout=config.MAIL_POLL_SECONDS
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._disconnect()
+
+
+mail_service = MailService()
@@ -1,21 +1,144 @@
-import os
-import shutil
+from datetime import datetime
 from typing import Optional
 from uuid import UUID
-from models.properties import Property, PropertyImage
+from models.properties import Property, PropertyImage, SEARCH_CONFIG, search_vector
 from sqlalchemy.ext.asyncio.session import AsyncSession
-from schemas.property_schemas import PropertyCreate, PropertyResponse, PropertyStatus
+from schemas.property_schemas import (
+    PropertyCreate,
+    PropertyResponse,
+    PropertyStatus,
+    PropertySort,
+)
 from sqlalchemy.orm import selectinload
-from sqlalchemy import and_
+from sqlalchemy import and_, or_, func, tuple_, update
 from sqlmodel import select
 from fastapi import status, HTTPException
 from models.users import User
+from core.pagination import encode_cursor, decode_cursor
+from core import geohash
+from core.cache import TTLCache
+from core.config import config
+from core.etag import make_etag, etag_matches
+from services.revision_service import revision_service
+from services.image_service import image_service
+from services.upload_service import upload_service
+from services.blob_service import blob_service
+
+LISTINGS_REVISION = "properties"
+FEATURED_REVISION = "featured_properties"
 
 
 class PropertyService:
+    def __init__(self):
+        self.featured_cache = TTLCache(maxsize=1, ttl=config.PROPERTY_CACHE_TTL)
+        self.search_cache = TTLCache(
+            maxsize=config.PROPERTY_CACHE_SIZE, ttl=config.PROPERTY_CACHE_TTL
+        )
+
+    async def _commit_listing_change(
+        self,
+        session: AsyncSession,
+        featured: bool,
+        property: Optional[Property] = None,
+    ):
+        # Every listing payload can change on a write, but the featured list
+        # only does when the property is (or was) featured. Revisions are
+        # bumped in the same transaction so ETags never outrun the data.
+        if property is not None:
+            property.revision += 1
+        await revision_service.bump_revision(LISTINGS_REVISION, session)
+        if featured:
+            await revision_service.bump_revision(FEATURED_REVISION, session)
+        await session.commit()
+        self.search_cache.clear()
+        if featured:
+            self.featured_cache.clear()
+
+    async def delete_agent(self, agent: User, session: AsyncSession):
+        # The foreign key would null agent_id on its own, but without bumping
+        # the listings' revisions or clearing the caches that serve them.
+        result = await session.execute(
+            update(Property)
+            .where(Property.agent_id == agent.id)  # type: ignore
+            .values(agent_id=None, revision=Property.revision + 1)
+            .returning(Property.featured)
+            .execution_options(synchronize_session=False)
+        )
+        featured = result.scalars().all()
+        await session.delete(agent)
+        if featured:
+            await self._commit_listing_change(session, any(featured))
+        else:
+            await session.commit()
+
+    def _image_variants(self, property_id, images):
+        variants = []
+        for img in images:
+            if img.blob_key:
+                base_url = blob_service.blob_base_url(img.blob_key)
+                name = img.blob_key
+            else:
+                base_url = f"/uploads/properties/{property_id}"
+                name = img.file_name
+            variants.append(
+                image_service.variant_urls(base_url, name, img.has_variants)
+            )
+        return variants
+
+    async def _save_images(self, property_id, files, session: AsyncSession):
+        blobs = await blob_service.store_many(files, session)
+        for file, blob in zip(files, blobs):
+            session.add(
+                PropertyImage(
+                    file_name=upload_service.safe_name(file.filename),
+                    property_id=property_id,
+                    blob_key=blob.key,
+                    has_variants=blob.has_variants,
+                )
+            )
+
+    async def _release_images(self, property_id, session: AsyncSession) -> bool:
+        # Drops one blob reference per image row; returns whether the
+        # property still had images from before the blob store existed.
+        result = await session.execute(
+            select(PropertyImage.blob_key).where(
+                PropertyImage.property_id == property_id
+            )
+        )
+        keys = result.scalars().all()
+        await blob_service.release(keys, session)
+        return any(key is None for key in keys)
+
+    async def _cleanup_images(
+        self, property_id, legacy_images: bool, session: AsyncSession
+    ):
+        # Runs after the commit, so a failure here must not fail the request.
+        try:
+            if legacy_images:
+                await upload_service.remove_tree(f"uploads/properties/{property_id}")
+            await blob_service.collect_garbage(session)
+        except Exception as e:
+            print(f"Error cleaning up images for property {property_id}: {e}")
+
     async def get_property(
-        self, property_id: str, session: AsyncSession
-    ) -> PropertyResponse:
+        self,
+        property_id: str,
+        session: AsyncSession,
+        if_none_match: Optional[str] = None,
+    ) -> tuple[str, Optional[PropertyResponse]]:
+        # The detail embeds the agent, so their revision is part of the ETag
+        if if_none_match:
+            result = await session.execute(
+                select(Property.revision, User.revision)
+                .outerjoin(User, Property.agent_id == User.id)  # type: ignore
+                .where(Property.id == property_id)
+            )
+            row = result.first()
+            if row is not None:
+                etag = make_etag("property", property_id, row[0], row[1] or 0)
+                if etag_matches(if_none_match, etag):
+                    return etag, None
+
         result = await session.execute(
             select(Property)
             .options(
@@ -32,6 +155,9 @@ class PropertyService:
             )
         prop_dict = property.model_dump()
         prop_dict["images"] = [img.file_name for img in property.images]
+        prop_dict["image_variants"] = self._image_variants(
+            property.id, property.images
+        )
         if property.agent:
             prop_dict["agent"] = {
                 "id": property.agent.id,
@@ -42,24 +168,130 @@ class PropertyService:
             }
         else:
             prop_dict["agent"] = None
-        return PropertyResponse.model_validate(prop_dict)
+        etag = make_etag(
+            "property",
+            property_id,
+            property.revision,
+            property.agent.revision if property.agent else 0,
+        )
+        return etag, PropertyResponse.model_validate(prop_dict)
 
-    async def get_properties(
+    def _sort_key(self, sort: PropertySort, ts_query=None):
+        if sort == PropertySort.relevance:
+            return func.ts_rank_cd(search_vector, ts_query), False
+        if sort == PropertySort.price_asc:
+            return Property.price, True
+        if sort == PropertySort.price_desc:
+            return Property.price, False
+        return Property.published_date, False
+
+    def _resolve_sort(self, sort: Optional[PropertySort], q: Optional[str]):
+        if sort is None:
+            return PropertySort.relevance if q else PropertySort.newest
+        if sort == PropertySort.relevance and not q:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Sorting by relevance requires a search query",
+            )
+        return sort
+
+    def _parse_cursor(self, cursor: str, sort: PropertySort):
+        sort_name, value, last_id = decode_cursor(cursor, 3)
+        if sort_name != sort.value:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cursor does not match the requested sort order",
+            )
+        try:
+            if sort == PropertySort.newest:
+                value = datetime.fromisoformat(value)
+            else:
+                value = float(value)
+            return value, UUID(last_id)
+        except (AttributeError, TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+            )
+
+    def _parse_bbox(self, bbox: str):
+        try:
+            min_lng, min_lat, max_lng, max_lat = (float(v) for v in bbox.split(","))
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="bbox must be min_lng,min_lat,max_lng,max_lat",
+            )
+        if not (
+            -90 <= min_lat <= max_lat <= 90
+            and -180 <= min_lng <= 180
+            and -180 <= max_lng <= 180
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="bbox is outside the valid latitude/longitude range",
+            )
+        return min_lat, min_lng, max_lat, max_lng
+
+    def _bbox_filter(self, min_lat, min_lng, max_lat, max_lng):
+        # A box crossing the antimeridian is searched as its two halves.
+        if min_lng > max_lng:
+            return or_(
+                self._bbox_filter(min_lat, min_lng, max_lat, 180.0),
+                self._bbox_filter(min_lat, -180.0, max_lat, max_lng),
+            )
+        cells = geohash.covering_cells(min_lat, min_lng, max_lat, max_lng)
+        ranges = []
+        for start, end in geohash.cell_ranges(cells):
+            if end is None:
+                ranges.append(Property.geohash >= start)  # type: ignore
+            else:
+                ranges.append(
+                    and_(Property.geohash >= start, Property.geohash < end)  # type: ignore
+                )
+        return and_(
+            or_(*ranges),
+            Property.latitude.between(min_lat, max_lat),  # type: ignore
+            Property.longitude.between(min_lng, max_lng),  # type: ignore
+        )
+
+    def _distance_km(self, lat: float, lng: float):
+        d_lat = func.radians(Property.latitude - lat)
+        d_lng = func.radians(Property.longitude - lng)
+        a = func.power(func.sin(d_lat * 0.5), 2) + func.cos(
+            func.radians(lat)
+        ) * func.cos(func.radians(Property.latitude)) * func.power(
+            func.sin(d_lng * 0.5), 2
+        )
+        return 2 * geohash.EARTH_RADIUS_KM * func.asin(func.sqrt(a))
+
+    def build_search_query(
         self,
-        sale_or_rent: Optional[str],
-        city: Optional[str],
-        min_price: Optional[float],
-        max_price: Optional[float],
-        type: Optional[str],
-        agent_id: Optional[str],
-        session: AsyncSession,
+        sale_or_rent: Optional[str] = None,
+        city: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        type: Optional[str] = None,
+        agent_id: Optional[str] = None,
+        sort: Optional[PropertySort] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        lat: Optional[float] = None,
+        lng: Optional[float] = None,
+        radius_km: Optional[float] = None,
+        bbox: Optional[str] = None,
+        q: Optional[str] = None,
     ):
+        sort = self._resolve_sort(sort, q)
+        ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, q) if q else None
+        column, ascending = self._sort_key(sort, ts_query)
         query = (
-            select(Property)
+            select(Property, column.label("sort_value"))
             .options(selectinload(Property.images))  # type: ignore
             .where(Property.status == PropertyStatus.available)
         )
         filters = []
+        if ts_query is not None:
+            filters.append(search_vector.op("@@")(ts_query))
         if sale_or_rent:
             filters.append(Property.sale_or_rent == sale_or_rent)
         if city:
@@ -72,40 +304,153 @@ class PropertyService:
             filters.append(Property.type == type)
         if agent_id:
             filters.append(Property.agent_id == agent_id)
+        if bbox:
+            filters.append(self._bbox_filter(*self._parse_bbox(bbox)))
+        near = (lat, lng, radius_km)
+        if any(v is not None for v in near):
+            if any(v is None for v in near):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="lat, lng and radius_km must be given together",
+                )
+            filters.append(
+                self._bbox_filter(*geohash.bbox_around(lat, lng, radius_km))  # type: ignore
+            )
+            filters.append(self._distance_km(lat, lng) <= radius_km)  # type: ignore
         if filters:
             query = query.where(and_(*filters))
+
+        # Keyset pagination: seek past the last row of the previous page on
+        # (sort column, id) instead of using OFFSET, so deep pages stay cheap.
+        key = tuple_(column, Property.id)
+        if cursor:
+            bound = tuple_(*self._parse_cursor(cursor, sort))
+            query = query.where(key > bound if ascending else key < bound)
+        if ascending:
+            query = query.order_by(column.asc(), Property.id.asc())  # type: ignore
+        else:
+            query = query.order_by(column.desc(), Property.id.desc())  # type: ignore
+        return query.limit(limit + 1)
+
+    async def get_properties(
+        self,
+        sale_or_rent: Optional[str],
+        city: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        type: Optional[str],
+        agent_id: Optional[str],
+        session: AsyncSession,
+        sort: Optional[PropertySort] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        lat: Optional[float] = None,
+        lng: Optional[float] = None,
+        radius_km: Optional[float] = None,
+        bbox: Optional[str] = None,
+        q: Optional[str] = None,
+        if_none_match: Optional[str] = None,
+    ):
+        cache_key = (
+            sale_or_rent,
+            city,
+            min_price,
+            max_price,
+            type,
+            agent_id,
+            sort,
+            limit,
+            cursor,
+            lat,
+            lng,
+            radius_km,
+            bbox,
+            q,
+        )
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            etag, page = cached
+            return etag, None if etag_matches(if_none_match, etag) else page
+        # Read the revision before the rows: if a write lands in between, the
+        # page is newer than its ETag, which only costs a spurious 200.
+        revision = await revision_service.get_revision(LISTINGS_REVISION, session)
+        etag = make_etag(LISTINGS_REVISION, revision)
+        if etag_matches(if_none_match, etag):
+            return etag, None
+        query = self.build_search_query(
+            sale_or_rent=sale_or_rent,
+            city=city,
+            min_price=min_price,
+            max_price=max_price,
+            type=type,
+            agent_id=agent_id,
+            sort=sort,
+            limit=limit,
+            cursor=cursor,
+            lat=lat,
+            lng=lng,
+            radius_km=radius_km,
+            bbox=bbox,
+            q=q,
+        )
         result = await session.execute(query)
-        properties = result.scalars().all()
+        rows = result.all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last, sort_value = rows[-1]
+            next_cursor = encode_cursor(
+                self._resolve_sort(sort, q).value, sort_value, last.id
+            )
         response = []
-        for prop in properties:
+        for prop, _ in rows:
             prop_dict = prop.model_dump()
             home_images = [
-                img.file_name for img in prop.images if img.file_name.startswith("home")
+                img for img in prop.images if img.file_name.startswith("home")
             ]
-            prop_dict["images"] = home_images
+            prop_dict["images"] = [img.file_name for img in home_images]
+            prop_dict["image_variants"] = self._image_variants(prop.id, home_images)
             response.append(prop_dict)
-        return response
+        page = {"items": response, "next_cursor": next_cursor}
+        self.search_cache.set(cache_key, (etag, page))
+        return etag, page
 
-    async def get_featured_properties(self, session: AsyncSession):
-        query = (
+    def build_featured_query(self):
+        return (
             select(Property)
             .options(selectinload(Property.images))  # type: ignore
             .where(
                 Property.featured,
                 Property.status == PropertyStatus.available,
             )
+            .order_by(Property.published_date.desc())  # type: ignore
         )
+
+    async def get_featured_properties(
+        self, session: AsyncSession, if_none_match: Optional[str] = None
+    ):
+        cached = self.featured_cache.get("featured")
+        if cached is not None:
+            etag, response = cached
+            return etag, None if etag_matches(if_none_match, etag) else response
+        revision = await revision_service.get_revision(FEATURED_REVISION, session)
+        etag = make_etag(FEATURED_REVISION, revision)
+        if etag_matches(if_none_match, etag):
+            return etag, None
+        query = self.build_featured_query()
         result = await session.execute(query)
         properties = result.scalars().all()
         response = []
         for prop in properties:
             prop_dict = prop.model_dump()
             home_images = [
-                img.file_name for img in prop.images if img.file_name.startswith("home")
+                img for img in prop.images if img.file_name.startswith("home")
             ]
-            prop_dict["images"] = home_images
+            prop_dict["images"] = [img.file_name for img in home_images]
+            prop_dict["image_variants"] = self._image_variants(prop.id, home_images)
             response.append(prop_dict)
-        return response
+        self.featured_cache.set("featured", (etag, response))
+        return etag, response
 
     async def create_property(
         self, property_data: PropertyCreate, files, session: AsyncSession
@@ -126,28 +471,24 @@ class PropertyService:
                 detail=f"User with ID: {property_data.agent_id} is not authorized to be an agent.",
             )
         new_property = Property(**property_data.model_dump())
+        new_property.geohash = geohash.encode(
+            property_data.latitude, property_data.longitude
+        )
         try:
             session.add(new_property)
-            await session.commit()
+            await self._commit_listing_change(session, featured=False)
             await session.refresh(new_property)
             property_id = new_property.id
 
             if files:
-                property_folder = f"uploads/properties/{property_id}"
-                os.makedirs(property_folder, exist_ok=True)
-
-                for file in files:
-                    file_path = os.path.join(property_folder, file.filename)
-                    with open(file_path, "wb") as buffer:
-                        shutil.copyfileobj(file.file, buffer)
-
-                    image = PropertyImage(
-                        file_name=file.filename,
-                        property_id=property_id,  # type: ignore
-                    )
-                    session.add(image)
-                await session.commit()
+                await self._save_images(property_id, files, session)
+                await self._commit_listing_change(
+                    session, featured=False, property=new_property
+                )
 
+        except HTTPException:
+            await session.rollback()
+            raise
         except Exception as e:
             await session.rollback()
             raise HTTPException(
@@ -168,12 +509,10 @@ class PropertyService:
                 detail=f"Property with id: {property_id} is not found",
             )
 
-        property_folder = f"uploads/properties/{property_id}"
-        if os.path.exists(property_folder):
-            shutil.rmtree(property_folder)
-
+        legacy_images = await self._release_images(property_id, session)
         await session.delete(property)
-        await session.commit()
+        await self._commit_listing_change(session, featured=property.featured)
+        await self._cleanup_images(property_id, legacy_images, session)
 
     async def update_property(
         self,
@@ -193,34 +532,28 @@ class PropertyService:
         # Update property fields
         for k, v in property_update_data.model_dump().items():
             setattr(property_obj, k, v)
+        property_obj.geohash = geohash.encode(
+            property_update_data.latitude, property_update_data.longitude
+        )
 
         # Handle image files
         if files:
-            property_folder = f"uploads/properties/{id}"
-
-            # Remove old images from disk
-            if os.path.exists(property_folder):
-                shutil.rmtree(property_folder)
-            os.makedirs(property_folder, exist_ok=True)
-
-            # Remove old PropertyImage records
+            # Remove old PropertyImage records and their blob references;
+            # re-uploaded images take the reference straight back.
+            legacy_images = await self._release_images(id, session)
             await session.execute(
                 PropertyImage.__table__.delete().where(PropertyImage.property_id == id)  # type: ignore
             )
 
-            # Save new images and create PropertyImage records
-            for file in files:
-                file_path = os.path.join(property_folder, file.filename)
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(file.file, buffer)
-                image = PropertyImage(
-                    file_name=file.filename,
-                    property_id=id,  # type: ignore
-                )
-                session.add(image)
+            # Store new images and create PropertyImage records
+            await self._save_images(id, files, session)
 
-        await session.commit()
+        await self._commit_listing_change(
+            session, featured=property_obj.featured, property=property_obj
+        )
         await session.refresh(property_obj)
+        if files:
+            await self._cleanup_images(id, legacy_images, session)
 
     async def update_featured(
         self, property_id: str, featured: bool, session: AsyncSession
@@ -231,9 +564,12 @@ class PropertyService:
         property = result.scalars().first()
         if not property:
             raise HTTPException(status_code=404, detail="Property not found")
-        property.featured = featured
-        await session.commit()
-        await session.refresh(property)
+        if property.featured != featured:
+            property.featured = featured
+            await self._commit_listing_change(
+                session, featured=True, property=property
+            )
+            await session.refresh(property)
         return PropertyResponse.model_validate(property)
 
     async def update_status(
@@ -246,7 +582,9 @@ class PropertyService:
         if not property:
             raise HTTPException(status_code=404, detail="Property not found")
         property.status = PropertyStatus(status)
-        await session.commit()
+        await self._commit_listing_change(
+            session, featured=property.featured, property=property
+        )
         await session.refresh(property)
 
 
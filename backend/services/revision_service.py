@@ -0,0 +1,25 @@
+from models.revisions import TableRevision
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio.session import AsyncSession
+from sqlmodel import select
+
+
+class RevisionService:
+    async def get_revision(self, name: str, session: AsyncSession) -> int:
+        result = await session.execute(
+            select(TableRevision.revision).where(TableRevision.name == name)
+        )
+        return result.scalar() or 0
+
+    async def bump_revision(self, name: str, session: AsyncSession) -> None:
+        # Runs inside the caller's transaction, so the new revision becomes
+        # visible together with the change it describes.
+        stmt = insert(TableRevision).values(name=name, revision=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TableRevision.name],
+            set_={"revision": TableRevision.revision + 1},
+        )
+        await session.execute(stmt)
+
+
+revision_service = RevisionService()
@@ -0,0 +1,211 @@
+import heapq
+import time
+from abc import ABC, abstractmethod
+from enum import Enum
+from typing import NamedTuple, Optional
+from core.config import config
+
+
+class RotateResult(str, Enum):
+    rotated = "rotated"
+    reused = "reused"
+    unknown = "unknown"
+
+
+class RefreshFamily(NamedTuple):
+    user_id: str
+    jti: str
+    expires_at: float
+
+
+class RefreshTokenStore(ABC):
+    # Every login starts a family; each refresh swaps the family's current
+    # jti for a new one. Presenting a jti that was already swapped out means
+    # the token was copied, so the whole family is revoked.
+    @abstractmethod
+    async def issue(self, family_id: str, user_id: str, jti: str, expires_at: float):
+        ...
+
+    @abstractmethod
+    async def rotate(
+        self, family_id: str, jti: str, new_jti: str, expires_at: float
+    ) -> RotateResult:
+        ...
+
+    @abstractmethod
+    async def revoke_family(self, family_id: str):
+        ...
+
+    @abstractmethod
+    async def revoke_user(self, user_id: str):
+        ...
+
+    @abstractmethod
+    async def sweep(self) -> int:
+        ...
+
+    async def close(self):
+        pass
+
+
+class MemoryRefreshTokenStore(RefreshTokenStore):
+    # Process local: fine for a single worker, but use Redis when several
+    # workers or nodes share refresh traffic.
+    def __init__(self):
+        self._families: dict[str, RefreshFamily] = {}
+        self._user_families: dict[str, set[str]] = {}
+        self._expiry: list[tuple[float, str]] = []
+
+    def _drop(self, family_id: str):
+        family = self._families.pop(family_id, None)
+        if family is None:
+            return
+        families = self._user_families.get(family.user_id)
+        if families is not None:
+            families.discard(family_id)
+            if not families:
+                del self._user_families[family.user_id]
+
+    def _get(self, family_id: str) -> Optional[RefreshFamily]:
+        family = self._families.get(family_id)
+        if family is not None and family.expires_at <= time.time():
+            self._drop(family_id)
+            return None
+        return family
+
+    async def issue(self, family_id: str, user_id: str, jti: str, expires_at: float):
+        await self.sweep()
+        self._families[family_id] = RefreshFamily(user_id, jti, expires_at)
+        self._user_families.setdefault(user_id, set()).add(family_id)
+        heapq.heappush(self._expiry, (expires_at, family_id))
+
+    async def rotate(
+        self, family_id: str, jti: str, new_jti: str, expires_at: float
+    ) -> RotateResult:
+        family = self._get(family_id)
+        if family is None:
+            return RotateResult.unknown
+        if family.jti != jti:
+            self._drop(family_id)
+            return RotateResult.reused
+        self._families[family_id] = RefreshFamily(family.user_id, new_jti, expires_at)
+        heapq.heappush(self._expiry, (expires_at, family_id))
+        return RotateResult.rotated
+
+    async def revoke_family(self, family_id: str):
+        self._drop(family_id)
+
+    async def revoke_user(self, user_id: str):
+        for family_id in list(self._user_families.get(user_id, ())):
+            self._drop(family_id)
+
+    async def sweep(self) -> int:
+        # Heap entries left behind by rotation or revocation are skipped; a
+        # family is only dropped once its latest expiry has passed.
+        now = time.time()
+        removed = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            _, family_id = heapq.heappop(self._expiry)
+            family = self._families.get(family_id)
+            if family is not None and family.expires_at <= now:
+                self._drop(family_id)
+                removed += 1
+        return removed
+
+
+# Compare-and-swap of the family's jti; a mismatch deletes the family.
+# ARGV: presented jti, new jti, new expiry, user key prefix, family id.
+ROTATE_SCRIPT = """
+local family = redis.call('HMGET', KEYS[1], 'user', 'jti')
+if not family[2] then
+    return 0
+end
+local user_key = ARGV[4] .. family[1]
+if family[2] ~= ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    redis.call('ZREM', user_key, ARGV[5])
+    return -1
+end
+redis.call('HSET', KEYS[1], 'jti', ARGV[2])
+redis.call('EXPIREAT', KEYS[1], ARGV[3])
+redis.call('ZADD', user_key, ARGV[3], ARGV[5])
+redis.call('EXPIREAT', user_key, ARGV[3])
+return 1
+"""
+
+
+class RedisRefreshTokenStore(RefreshTokenStore):
+    # Families are hashes that Redis expires on its own; each user keeps a
+    # sorted set of family ids scored by expiry for logout-everywhere. Every
+    # issue or rotation carries the newest expiry, so it also becomes the
+    # expiry of the user's set.
+    def __init__(self, url: str, prefix: str = "refresh"):
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError(
+                "REFRESH_TOKEN_STORE_URL is set but the redis package is not installed"
+            )
+        self._redis = redis.from_url(url, decode_responses=True)
+        self._rotate = self._redis.register_script(ROTATE_SCRIPT)
+        self._prefix = prefix
+
+    def _family_key(self, family_id: str) -> str:
+        return f"{self._prefix}:family:{family_id}"
+
+    def _user_key(self, user_id: str = "") -> str:
+        return f"{self._prefix}:user:{user_id}"
+
+    async def issue(self, family_id: str, user_id: str, jti: str, expires_at: float):
+        family_key = self._family_key(family_id)
+        user_key = self._user_key(user_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(family_key, mapping={"user": user_id, "jti": jti})
+            pipe.expireat(family_key, int(expires_at))
+            pipe.zremrangebyscore(user_key, "-inf", time.time())
+            pipe.zadd(user_key, {family_id: expires_at})
+            pipe.expireat(user_key, int(expires_at))
+            await pipe.execute()
+
+    async def rotate(
+        self, family_id: str, jti: str, new_jti: str, expires_at: float
+    ) -> RotateResult:
+        result = await self._rotate(
+            keys=[self._family_key(family_id)],
+            args=[jti, new_jti, int(expires_at), self._user_key(), family_id],
+        )
+        if result == 1:
+            return RotateResult.rotated
+        if result == -1:
+            return RotateResult.reused
+        return RotateResult.unknown
+
+    async def revoke_family(self, family_id: str):
+        family_key = self._family_key(family_id)
+        user_id = await self._redis.hget(family_key, "user")
+        await self._redis.delete(family_key)
+        if user_id:
+            await self._redis.zrem(self._user_key(user_id), family_id)
+
+    async def revoke_user(self, user_id: str):
+        user_key = self._user_key(user_id)
+        family_ids = await self._redis.zrange(user_key, 0, -1)
+        await self._redis.delete(
+            user_key, *(self._family_key(family_id) for family_id in family_ids)
+        )
+
+    async def sweep(self) -> int:
+        # Redis expires families itself; per-user sets are trimmed on issue.
+        return 0
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+def create_refresh_token_store() -> RefreshTokenStore:
+    if config.REFRESH_TOKEN_STORE_URL:
+        return RedisRefreshTokenStore(config.REFRESH_TOKEN_STORE_URL)
+    return MemoryRefreshTokenStore()
+
+
+refresh_token_store = create_refresh_token_store()
@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+import os
+import shutil
+from typing import NamedTuple, Optional
+from uuid import uuid4
+from fastapi import HTTPException, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+from core.config import config
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _write_chunk(buffer, digest, chunk: bytes):
+    buffer.write(chunk)
+    digest.update(chunk)
+
+
+class StoredUpload(NamedTuple):
+    size: int
+    sha256: str
+
+
+class UploadService:
+    def safe_name(self, filename: Optional[str]) -> str:
+        # Client-supplied names must never escape the destination folder.
+        name = os.path.basename((filename or "").replace("\\", "/"))
+        if name in ("", ".", ".."):
+            return uuid4().hex
+        return name
+
+    async def save(
+        self, upload: UploadFile, dest_path: str, max_bytes: Optional[int] = None
+    ) -> StoredUpload:
+        # Streams the upload to a temp file in the destination folder and
+        # renames it into place, so readers never see a partial file.
+        limit = max_bytes or config.MAX_UPLOAD_BYTES
+        directory = os.path.dirname(dest_path)
+        await run_in_threadpool(os.makedirs, directory, exist_ok=True)
+        tmp_path = os.path.join(directory, f".{uuid4().hex}.part")
+        size = 0
+        digest = hashlib.sha256()
+        buffer = await run_in_threadpool(open, tmp_path, "wb")
+        try:
+            while chunk := await upload.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > limit:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"{upload.filename} exceeds the {limit} byte upload limit",
+                    )
+                await run_in_threadpool(_write_chunk, buffer, digest, chunk)
+            await run_in_threadpool(buffer.close)
+            await run_in_threadpool(os.replace, tmp_path, dest_path)
+        except BaseException:
+            buffer.close()
+            await run_in_threadpool(_remove_file, tmp_path)
+            raise
+        return StoredUpload(size, digest.hexdigest())
+
+    async def save_many(
+        self, uploads: list[tuple[UploadFile, str]], max_bytes: Optional[int] = None
+    ) -> list[StoredUpload]:
+        # All or nothing: if any file fails, the ones that did land are removed.
+        semaphore = asyncio.Semaphore(config.UPLOAD_CONCURRENCY)
+
+        async def save_one(upload: UploadFile, dest_path: str):
+            async with semaphore:
+                return await self.save(upload, dest_path, max_bytes)
+
+        results = await asyncio.gather(
+            *(save_one(upload, path) for upload, path in uploads),
+            return_exceptions=True,
+        )
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            for (_, path), result in zip(uploads, results):
+                if not isinstance(result, BaseException):
+                    await run_in_threadpool(_remove_file, path)
+            raise errors[0]
+        return results  # type: ignore
+
+    async def remove(self, path: str):
+        await run_in_threadpool(_remove_file, path)
+
+    async def remove_tree(self, path: str):
+        await run_in_threadpool(shutil.rmtree, path, True)
+
+
+upload_service = UploadService()
@@ -1,15 +1,59 @@
 import os
-import shutil
-from models.users import User
+from typing import NamedTuple, Optional
+from uuid import UUID
+from models.users import User, Roles
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from schemas.user_schemas import UserRead, UserCreate, UserUpdate
 from sqlmodel import select
 from fastapi import status, HTTPException
-from security.security import hash_password, verify_password
+from security.security import hash_password, password_hasher, verify_password
+from services.upload_service import upload_service
+from services.property_service import property_service
+from core.cache import TTLCache
+from core.config import config
+
+
+class UserState(NamedTuple):
+    is_active: bool
+    role: Roles
+    token_version: int
 
 
 class UserService:
+    def __init__(self):
+        # Lets token checks skip the users table; a change made on another
+        # worker is picked up once its entry expires.
+        self.state_cache = TTLCache(
+            maxsize=config.USER_STATE_CACHE_SIZE, ttl=config.USER_STATE_CACHE_TTL
+        )
+
+    async def get_user_state(
+        self, user_id: UUID, session: AsyncSession
+    ) -> Optional[UserState]:
+        state = self.state_cache.get(user_id)
+        if state is None:
+            result = await session.execute(
+                select(User.is_active, User.role, User.token_version).where(
+                    User.id == user_id
+                )
+            )
+            row = result.first()
+            if row is None:
+                return None
+            state = UserState(*row)
+            self.state_cache.set(user_id, state)
+        return state
+
+    def _revoke_tokens(self, user: User):
+        user.token_version += 1
+
+    async def revoke_tokens(self, user_id, session: AsyncSession):
+        user = await self.get_user(user_id, session)
+        self._revoke_tokens(user)
+        await session.commit()
+        self.state_cache.invalidate(user.id)
+
     async def create_user(
         self, user_data: UserCreate, avatar, session: AsyncSession
     ) -> UserRead:
@@ -17,15 +61,17 @@ class UserService:
         if avatar:
             user_folder = f"uploads/avatars/{user_data.username}"
             try:
-                os.makedirs(user_folder, exist_ok=True)
                 avatar_path = os.path.join(
                     user_folder, "avatar" + os.path.splitext(avatar.filename)[1]
                 )
 
-                with open(avatar_path, "wb") as buffer:
-                    shutil.copyfileobj(avatar.file, buffer)
+                await upload_service.save(
+                    avatar, avatar_path, max_bytes=config.MAX_AVATAR_BYTES
+                )
                 web_avatar_url_for_db = f"/{avatar_path.replace('\\', '/')}"
 
+            except HTTPException:
+                raise
             except Exception as e:
                 print(f"Error saving avatar: {e}")
                 raise HTTPException(
@@ -33,7 +79,7 @@ class UserService:
                 )
 
         new_user_data = user_data.model_dump()
-        new_user_data["hashed_password"] = hash_password(
+        new_user_data["hashed_password"] = await hash_password(
             new_user_data.pop("hashed_password")
         )
         if web_avatar_url_for_db:
@@ -75,12 +121,23 @@ class UserService:
 
         user = result.scalars().first()
 
-        if not user or not verify_password(password, user.hashed_password):
+        valid, new_hash = False, None
+        if user:
+            valid, new_hash = await password_hasher.verify_and_update(
+                password, user.hashed_password
+            )
+        if not user or not valid:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid Credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        if new_hash:
+            # Stored with older Argon2 parameters; upgrade while we have the
+            # plain password.
+            user.hashed_password = new_hash
+            await session.commit()
+            await session.refresh(user)
         return UserRead.model_validate(user.model_dump())
 
     async def get_agents(self, session: AsyncSession):
@@ -113,29 +170,39 @@ class UserService:
 
         # Handle avatar update
         if avatar:
-            # Remove old avatar if exists
-            if user.avatar_url:
-                old_avatar_path = user.avatar_url.lstrip("/")
-                if os.path.exists(old_avatar_path):
-                    os.remove(old_avatar_path)
             user_folder = f"uploads/avatars/{user_update_data.username}"
-            os.makedirs(user_folder, exist_ok=True)
             avatar_path = os.path.join(
                 user_folder, "avatar" + os.path.splitext(avatar.filename)[1]
             )
-            with open(avatar_path, "wb") as buffer:
-                shutil.copyfileobj(avatar.file, buffer)
+            await upload_service.save(
+                avatar, avatar_path, max_bytes=config.MAX_AVATAR_BYTES
+            )
             web_avatar_url_for_db = f"/{avatar_path.replace('\\', '/')}"
+            # Remove the old avatar only once the new one is safely on disk
+            if user.avatar_url:
+                old_avatar_path = user.avatar_url.lstrip("/")
+                if old_avatar_path != avatar_path.replace("\\", "/"):
+                    await upload_service.remove(old_avatar_path)
+
+        # Role changes and deactivation invalidate the user's existing tokens
+        revoke = user.role != user_update_data.role or (
+            user_update_data.is_active is not None
+            and user.is_active != user_update_data.is_active
+        )
 
         # Update user fields
-        for k, v in user_update_data.model_dump().items():
+        for k, v in user_update_data.model_dump(exclude_none=True).items():
             if k == "hashed_password":
-                v = hash_password(v)
+                v = await hash_password(v)
             setattr(user, k, v)
         if web_avatar_url_for_db:
             user.avatar_url = web_avatar_url_for_db
+        user.revision += 1
+        if revoke:
+            self._revoke_tokens(user)
 
         await session.commit()
+        self.state_cache.invalidate(user.id)
         await session.refresh(user)
         return UserRead.model_validate(user.model_dump())
 
@@ -152,12 +219,14 @@ class UserService:
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         # Check old password
-        if not verify_password(old_password, user.hashed_password):
+        if not await verify_password(old_password, user.hashed_password):
             raise HTTPException(status_code=400, detail="Old password is incorrect")
         # Update username and password
         user.username = username
-        user.hashed_password = hash_password(new_password)
+        user.hashed_password = await hash_password(new_password)
+        self._revoke_tokens(user)
         await session.commit()
+        self.state_cache.invalidate(user.id)
         await session.refresh(user)
         return {"message": "Profile updated successfully"}
 
@@ -166,10 +235,9 @@ class UserService:
         if user.avatar_url:
             old_avatar_path = user.avatar_url.lstrip("/")
             old_avatar_folder = os.path.dirname(old_avatar_path)
-            if os.path.exists(old_avatar_folder):
-                shutil.rmtree(old_avatar_folder)
-        await session.delete(user)
-        await session.commit()
+            await upload_service.remove_tree(old_avatar_folder)
+        await property_service.delete_agent(user, session)
+        self.state_cache.invalidate(user.id)
         return {"detail": f'User "{user.username}" deleted successfully'}
 
 